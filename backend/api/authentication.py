@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+from .cache_versions import bump_version, get_version
+
+SHARED_CACHE_KEY = "auth_token:{}"
+
+
+def user_version_name(user_id):
+    return f"auth:{user_id}"
+
+
+def invalidate_user_tokens(user_id, keys=()):
+    """Удаляет токены пользователя из кеша процесса и общего кеша и
+    делает устаревшими их копии в кешах других процессов"""
+    token_cache.delete_user(user_id)
+    cache.delete_many([SHARED_CACHE_KEY.format(key) for key in keys])
+    bump_version(user_version_name(user_id))
+
+
+class TokenCache:
+    """LRU-кеш процесса с ограниченным временем жизни записей"""
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + self.timeout)
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def delete_user(self, user_id):
+        with self.lock:
+            for key, ((token, version), expires) in list(self.items.items()):
+                if token.user_id == user_id:
+                    del self.items[key]
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+token_cache = TokenCache(
+    settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TIMEOUT
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе на каждый вызов.
+
+    Токен вместе с пользователем хранится в кеше процесса и, при
+    AUTH_TOKEN_SHARED_CACHE, в общем кеше. Запись действительна, пока
+    не изменилось поколение пользователя: его увеличивают сигналы
+    удаления токена и сохранения пользователя."""
+
+    def get_cached(self, key):
+        cached = token_cache.get(key)
+        if cached is None and settings.AUTH_TOKEN_SHARED_CACHE:
+            cached = cache.get(SHARED_CACHE_KEY.format(key))
+            if cached is not None:
+                token_cache.set(key, cached)
+        if cached is None:
+            return None
+        token, version = cached
+        if version != get_version(user_version_name(token.user_id)):
+            return None
+        return token
+
+    def authenticate_credentials(self, key):
+        token = self.get_cached(key)
+        if token is not None:
+            return token.user, token
+        user, token = super().authenticate_credentials(key)
+        cached = (token, get_version(user_version_name(user.pk)))
+        token_cache.set(key, cached)
+        if settings.AUTH_TOKEN_SHARED_CACHE:
+            cache.set(
+                SHARED_CACHE_KEY.format(key),
+                cached,
+                settings.AUTH_TOKEN_CACHE_TIMEOUT,
+            )
+        return user, token
@@ -0,0 +1,37 @@
+import time
+from uuid import uuid4
+
+from django.core.cache import cache
+
+VERSION_CACHE_KEY = "version:{}"
+
+
+def new_version():
+    """Поколение - время создания и случайная строка, а не счетчик:
+    после вытеснения ключа создается новое значение, и выданные
+    ранее поколения никогда не совпадут с ним снова"""
+    return f"{int(time.time())}-{uuid4().hex}"
+
+
+def get_version(name):
+    """Текущее поколение данных name в общем кеше"""
+    key = VERSION_CACHE_KEY.format(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_version_time(name):
+    """Время создания текущего поколения данных name в секундах"""
+    created, _, _ = get_version(name).partition("-")
+    return int(created) if created.isdigit() else None
+
+
+def bump_version(name):
+    """Заменяет поколение данных name, делая устаревшими
+    все построенные по ним копии"""
+    version = new_version()
+    cache.set(VERSION_CACHE_KEY.format(name), version, None)
+    return version
@@ -0,0 +1,52 @@
+import hashlib
+import json
+from calendar import timegm
+
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """Сильный ETag по значениям, от которых зависит ответ"""
+    data = json.dumps(parts, default=str, sort_keys=True)
+    return '"{}"'.format(hashlib.sha1(data.encode("utf-8")).hexdigest())
+
+
+def to_timestamp(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return timegm(value.utctimetuple())
+
+
+def latest(*values):
+    """Наибольшая из отметок времени, None пропускаются"""
+    return max(
+        filter(None, map(to_timestamp, values)), default=None
+    )
+
+
+def conditional_response(request, get_response, etag, last_modified=None):
+    """Отвечает 304 по If-None-Match или If-Modified-Since, не вызывая
+    get_response, иначе добавляет валидаторы к полному ответу.
+
+    Ответы авторизованных пользователей помечаются как private."""
+    last_modified = to_timestamp(last_modified)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        response = get_response()
+        if response.status_code != 200:
+            return response
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(
+            response, public=True, max_age=0, must_revalidate=True
+        )
+    patch_vary_headers(response, ("Authorization",))
+    return response
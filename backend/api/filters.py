@@ -1,14 +1,35 @@
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Recipe
-from rest_framework.filters import SearchFilter
+from recipes.models import Recipe, Tag
 
+from .cache_versions import get_version
 
-class IngredientSearchFilter(SearchFilter):
-    search_param = "name"
+TAG_IDS_CACHE_KEY = "tag_ids:{}"
+TAG_IDS_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_tag_ids():
+    """Соответствие slug тега его id, обновляется при изменении тегов"""
+    key = TAG_IDS_CACHE_KEY.format(get_version("tags"))
+    tag_ids = cache.get(key)
+    if tag_ids is None:
+        tag_ids = dict(
+            Tag.objects.using(DEFAULT_DB_ALIAS).values_list("slug", "id")
+        )
+        cache.set(key, tag_ids, TAG_IDS_CACHE_TIMEOUT)
+    return tag_ids
+
+
+def get_tag_choices():
+    return [(slug, slug) for slug in get_tag_ids()]
 
 
 class RecipeFilter(FilterSet):
-    tags = filters.AllValuesMultipleFilter(field_name="tags__slug")
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tag_choices, method="filter_tags"
+    )
     is_favorited = filters.BooleanFilter(method="filter_is_favorited")
     is_in_shopping_cart = filters.BooleanFilter(
         method="filter_is_in_shopping_cart"
@@ -18,6 +39,17 @@ class RecipeFilter(FilterSet):
         model = Recipe
         fields = ("tags", "author", "is_favorited", "is_in_shopping_cart")
 
+    def filter_tags(self, queryset, name, value):
+        tag_ids = get_tag_ids()
+        return queryset.annotate(
+            has_tags=Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=OuterRef("pk"),
+                    tag_id__in=[tag_ids[slug] for slug in value],
+                )
+            )
+        ).filter(has_tags=True)
+
     def filter_is_favorited(self, queryset, name, value):
         if value:
             return queryset.filter(favorites__user=self.request.user)
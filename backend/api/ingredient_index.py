@@ -0,0 +1,145 @@
+import re
+import threading
+from bisect import bisect_left
+
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.db.models import FloatField, Func, Q, Value
+from recipes.models import Ingredient
+
+from .cache_versions import get_version
+
+SIMILARITY_THRESHOLD = 0.3
+WORD_RE = re.compile(r"\w+")
+
+
+def get_word_trigrams(word):
+    word = f"  {word} "
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def get_trigrams(value):
+    """Триграммы строки по правилам pg_trgm: всей строки и отдельно
+    каждого слова"""
+    words = [get_word_trigrams(word) for word in WORD_RE.findall(value)]
+    return set().union(*words), words
+
+
+def get_similarity(trigrams, other):
+    union = len(trigrams | other)
+    if not union:
+        return 0
+    return len(trigrams & other) / union
+
+
+def get_best_similarity(trigrams, other):
+    """Сходство с названием целиком или с лучшим из его слов:
+    «яйцо» находит «яйца куриные»"""
+    trigrams, _ = trigrams
+    whole, words = other
+    return max(get_similarity(trigrams, part) for part in (whole, *words))
+
+
+class WordSimilarity(Func):
+    """word_similarity из pg_trgm: сходство строки с наиболее похожей
+    частью поля"""
+
+    function = "WORD_SIMILARITY"
+    output_field = FloatField()
+
+    def __init__(self, expression, string, **extra):
+        super().__init__(Value(string), expression, **extra)
+
+
+class IngredientIndex:
+    """Отсортированный по названию список ингредиентов в памяти процесса
+    для поиска по началу названия и нечеткого поиска"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._keys = []
+        self._items = []
+        self._trigrams = []
+
+    def _load(self, version):
+        rows = sorted(
+            (name.lower(), pk, name, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.using(
+                DEFAULT_DB_ALIAS
+            ).values_list("id", "name", "measurement_unit")
+        )
+        self._keys = [row[0] for row in rows]
+        self._items = [
+            {"id": pk, "name": name, "measurement_unit": measurement_unit}
+            for _, pk, name, measurement_unit in rows
+        ]
+        self._trigrams = [get_trigrams(key) for key in self._keys]
+        self._version = version
+
+    def _ensure_loaded(self):
+        version = get_version("ingredients")
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._load(version)
+
+    def search(self, name, limit):
+        """Сначала ингредиенты, название которых начинается с name,
+        затем содержащие name или похожие на него по триграммам"""
+        results = self.search_prefix(name, limit)
+        if len(results) < limit:
+            exclude = {item["id"] for item in results}
+            if connection.vendor == "postgresql":
+                search_similar = self.search_similar_db
+            else:
+                search_similar = self.search_similar
+            results += search_similar(name, limit - len(results), exclude)
+        return results
+
+    def search_prefix(self, prefix, limit):
+        """Ингредиенты, название которых начинается с prefix.
+        Точное совпадение и более короткие названия идут первыми"""
+        self._ensure_loaded()
+        keys, items = self._keys, self._items
+        prefix = prefix.lower()
+        matches = []
+        position = bisect_left(keys, prefix)
+        while position < len(keys) and keys[position].startswith(prefix):
+            matches.append(position)
+            position += 1
+        matches.sort(key=lambda position: (len(keys[position]), position))
+        return [items[position] for position in matches[:limit]]
+
+    def search_similar(self, name, limit, exclude=()):
+        """Нечеткий поиск по названиям в памяти процесса"""
+        self._ensure_loaded()
+        keys, items = self._keys, self._items
+        name = name.lower()
+        trigrams = get_trigrams(name)
+        scored = []
+        for position, other in enumerate(self._trigrams):
+            if items[position]["id"] in exclude:
+                continue
+            similarity = get_best_similarity(trigrams, other)
+            if similarity >= SIMILARITY_THRESHOLD or name in keys[position]:
+                scored.append((-similarity, keys[position], position))
+        scored.sort()
+        return [items[position] for _, _, position in scored[:limit]]
+
+    @staticmethod
+    def search_similar_db(name, limit, exclude=()):
+        """Нечеткий поиск в PostgreSQL средствами pg_trgm по словам
+        названия"""
+        similar = Q(similarity__gte=SIMILARITY_THRESHOLD)
+        return list(
+            Ingredient.objects.annotate(
+                similarity=WordSimilarity("name", name)
+            )
+            .filter(similar | Q(name__icontains=name))
+            .exclude(pk__in=exclude)
+            .order_by("-similarity", "name")
+            .values("id", "name", "measurement_unit")[:limit]
+        )
+
+
+ingredient_index = IngredientIndex()
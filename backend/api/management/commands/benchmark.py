@@ -0,0 +1,458 @@
+import base64
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import wait
+from io import BytesIO, StringIO
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_databases, setup_test_environment,
+                               teardown_databases, teardown_test_environment)
+from django.utils import timezone
+from PIL import Image
+from recipes import images
+from recipes.models import Cart, Ingredient, Recipe, Tag
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+User = get_user_model()
+
+BUDGETS_PATH = os.path.join(
+    settings.BASE_DIR, "data", "benchmark_budgets.json"
+)
+PASSWORD = "benchmark-password"
+CART_SIZE = 20
+
+# Имя, метод, адрес, клиент, тело запроса и ожидаемый статус.
+# Сценарии выполняются по порядку, поэтому пары «создать - удалить»
+# возвращают данные в исходное состояние перед следующим кругом.
+# Регистрация каждый раз получает новые данные, смена пароля оставляет
+# прежний пароль.
+SCENARIOS = (
+    ("recipes_list", "get", "/api/recipes/", "anon", None, 200),
+    ("recipes_list_auth", "get", "/api/recipes/", "user", None, 200),
+    ("recipes_list_page", "get", "/api/recipes/?page=50", "user", None, 200),
+    ("recipes_list_cursor", "get", "/api/recipes/?cursor=", "user", None,
+     200),
+    ("recipes_list_tags", "get", "/api/recipes/?tags={tag}&tags={other_tag}",
+     "user", None, 200),
+    ("recipes_list_author", "get", "/api/recipes/?author={author}", "user",
+     None, 200),
+    ("recipes_list_favorited", "get", "/api/recipes/?is_favorited=1", "user",
+     None, 200),
+    ("recipes_list_in_cart", "get", "/api/recipes/?is_in_shopping_cart=1",
+     "user", None, 200),
+    ("recipe_detail", "get", "/api/recipes/{recipe}/", "anon", None, 200),
+    ("recipe_detail_auth", "get", "/api/recipes/{recipe}/", "user", None,
+     200),
+    ("recipe_create", "post", "/api/recipes/", "user", "recipe_data", 201),
+    ("recipe_update", "patch", "/api/recipes/{created}/", "user",
+     "recipe_data", 200),
+    ("recipe_replace", "put", "/api/recipes/{created}/", "user",
+     "recipe_data", 200),
+    ("recipe_delete", "delete", "/api/recipes/{created}/", "user", None,
+     204),
+    ("favorite_add", "post", "/api/recipes/{recipe}/favorite/", "user", None,
+     201),
+    ("favorite_delete", "delete", "/api/recipes/{recipe}/favorite/", "user",
+     None, 204),
+    ("shopping_cart_add", "post", "/api/recipes/{recipe}/shopping_cart/",
+     "user", None, 201),
+    ("shopping_cart_delete", "delete",
+     "/api/recipes/{recipe}/shopping_cart/", "user", None, 204),
+    ("download_shopping_cart", "get", "/api/recipes/download_shopping_cart/",
+     "user", None, 200),
+    ("download_shopping_cart_csv", "get",
+     "/api/recipes/download_shopping_cart/?format=csv", "user", None, 200),
+    ("download_shopping_cart_json", "get",
+     "/api/recipes/download_shopping_cart/?format=json", "user", None, 200),
+    ("ingredients_list", "get", "/api/ingredients/", "anon", None, 200),
+    ("ingredients_search", "get", "/api/ingredients/?name={ingredient}",
+     "anon", None, 200),
+    ("ingredient_detail", "get", "/api/ingredients/{ingredient_id}/", "anon",
+     None, 200),
+    ("tags_list", "get", "/api/tags/", "anon", None, 200),
+    ("tag_detail", "get", "/api/tags/{tag_id}/", "anon", None, 200),
+    ("users_list", "get", "/api/users/", "user", None, 200),
+    ("user_detail", "get", "/api/users/{author}/", "user", None, 200),
+    ("users_me", "get", "/api/users/me/", "user", None, 200),
+    ("subscriptions", "get", "/api/users/subscriptions/", "user", None, 200),
+    ("subscriptions_limit", "get",
+     "/api/users/subscriptions/?recipes_limit=3", "user", None, 200),
+    ("subscriptions_empty", "get",
+     "/api/users/subscriptions/?recipes_limit=3", "reader", None, 200),
+    ("subscribe", "post", "/api/users/{author}/subscribe/", "user", None,
+     201),
+    ("unsubscribe", "delete", "/api/users/{author}/subscribe/", "user", None,
+     204),
+    ("registration", "post", "/api/users/", "anon", "registration_data",
+     201),
+    ("token_login", "post", "/api/auth/token/login/", "anon", "login_data",
+     200),
+    ("set_password", "post", "/api/users/set_password/", "login",
+     "password_data", 204),
+    ("token_logout", "post", "/api/auth/token/logout/", "login", None, 204),
+)
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=settings.BASE_DIR,
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_image_data():
+    buffer = BytesIO()
+    Image.new("RGB", (64, 64), "#E26C2D").save(buffer, "PNG")
+    return "data:image/png;base64," + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет тестовую базу фиксированным набором данных, вызывает "
+        "все эндпоинты API и сравнивает число SQL-запросов, время и пик "
+        "памяти с бюджетами из data/benchmark_budgets.json."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--recipes", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Число замеров каждого сценария",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.5,
+            help="Допустимое превышение бюджета времени и памяти",
+        )
+        parser.add_argument("--budgets", default=BUDGETS_PATH)
+        parser.add_argument("--report", help="Путь для JSON-отчета")
+        parser.add_argument(
+            "--update-budgets",
+            action="store_true",
+            help="Записать текущие замеры как новые бюджеты",
+        )
+        parser.add_argument(
+            "--only",
+            action="append",
+            help="Показать только указанные сценарии",
+        )
+
+    def seed(self, options):
+        """Фиксированный набор данных и состояние для сценариев"""
+        quiet = StringIO()
+        call_command("load_ingredients", stdout=quiet)
+        call_command("load_tags", stdout=quiet)
+        call_command(
+            "generate_data",
+            users=options["users"],
+            recipes=options["recipes"],
+            seed=options["seed"],
+            stdout=quiet,
+        )
+        user, login_user = User.objects.order_by("id")[:2]
+        login_user.set_password(PASSWORD)
+        login_user.save()
+        for recipe_id in Recipe.objects.exclude(
+            cart__user=user
+        ).values_list("id", flat=True)[:CART_SIZE]:
+            Cart.objects.create(user=user, recipe_id=recipe_id)
+
+        recipe = Recipe.objects.exclude(author=user).exclude(
+            favorites__user=user
+        ).exclude(cart__user=user).order_by("id").first()
+        author = User.objects.exclude(id=user.id).exclude(
+            author_to_follow__user=user
+        ).order_by("id").first()
+        reader = User.objects.create_user(
+            username="benchmark_reader",
+            email="benchmark_reader@example.com",
+            password=PASSWORD,
+        )
+        tags = list(Tag.objects.order_by("id")[:2])
+        ingredients = list(Ingredient.objects.order_by("id")[:3])
+        self.clients = {
+            "anon": APIClient(),
+            "user": self.get_client(user),
+            "reader": self.get_client(reader),
+        }
+        self.registrations = 0
+        self.context = {
+            "recipe": recipe.id,
+            "author": author.id,
+            "tag": tags[0].slug,
+            "other_tag": tags[-1].slug,
+            "tag_id": tags[0].id,
+            "ingredient": ingredients[0].name[:3],
+            "ingredient_id": ingredients[0].id,
+            "recipe_data": {
+                "name": "Рецепт для замера",
+                "text": "Описание",
+                "cooking_time": 10,
+                "tags": [tag.id for tag in tags],
+                "ingredients": [
+                    {"id": ingredient.id, "amount": 100}
+                    for ingredient in ingredients
+                ],
+                "image": get_image_data(),
+            },
+            "login_data": {"email": login_user.email, "password": PASSWORD},
+            "password_data": {
+                "current_password": PASSWORD,
+                "new_password": PASSWORD,
+            },
+            "registration_data": self.get_registration_data(),
+        }
+
+    @staticmethod
+    def get_client(user):
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user)}"
+        )
+        return client
+
+    def get_registration_data(self):
+        username = f"benchmark_new_{self.registrations}"
+        return {
+            "email": f"{username}@example.com",
+            "username": username,
+            "first_name": "Имя",
+            "last_name": "Фамилия",
+            "password": PASSWORD,
+        }
+
+    def track_image_jobs(self):
+        """Откладывает фоновую обработку изображений до конца замера:
+        в общей базе SQLite в памяти она блокирует таблицы запроса"""
+        self.image_jobs = []
+        self.submit_image_job = images.executor.submit
+
+        def deferred_submit(*args, **kwargs):
+            self.image_jobs.append((args, kwargs))
+
+        images.executor.submit = deferred_submit
+
+    def run_image_jobs(self):
+        wait([
+            self.submit_image_job(*args, **kwargs)
+            for args, kwargs in self.image_jobs
+        ])
+        self.image_jobs.clear()
+
+    def request(self, scenario, trace):
+        name, method, url, client, data, expected = scenario
+        url = url.format(**self.context)
+        data = self.context[data] if data else None
+        client = self.clients[client]
+        if trace:
+            tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            if method == "get":
+                response = client.get(url)
+            else:
+                response = getattr(client, method)(url, data, format="json")
+            if response.streaming:
+                content = b"".join(response.streaming_content)
+            else:
+                content = response.content
+            elapsed = time.perf_counter() - started
+        peak = 0
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.run_image_jobs()
+        if name == "recipe_create" and response.status_code == 201:
+            self.context["created"] = response.json()["id"]
+        if name == "registration" and response.status_code == 201:
+            self.registrations += 1
+            self.context["registration_data"] = self.get_registration_data()
+        if name == "token_login" and response.status_code == 200:
+            login = APIClient()
+            login.credentials(
+                HTTP_AUTHORIZATION=f"Token {response.json()['auth_token']}"
+            )
+            self.clients["login"] = login
+        return {
+            "status": response.status_code,
+            "expected_status": expected,
+            "queries": len(queries),
+            "time": elapsed,
+            "memory": peak,
+            "size": len(content),
+        }
+
+    def run_scenarios(self, repeat):
+        """Круг прогрева, repeat кругов замеров и круг с tracemalloc"""
+        samples = {scenario[0]: [] for scenario in SCENARIOS}
+        for round_number in range(repeat + 2):
+            trace = round_number == repeat + 1
+            for scenario in SCENARIOS:
+                sample = self.request(scenario, trace)
+                if trace:
+                    samples[scenario[0]][-1]["memory"] = sample["memory"]
+                elif round_number:
+                    samples[scenario[0]].append(sample)
+        results = {}
+        for name, runs in samples.items():
+            last = runs[-1]
+            results[name] = {
+                "status": last["status"],
+                "expected_status": last["expected_status"],
+                "queries": max(run["queries"] for run in runs),
+                "time_ms": round(
+                    statistics.median(run["time"] for run in runs) * 1000, 2
+                ),
+                "memory_kb": round(last["memory"] / 1024, 1),
+                "size": last["size"],
+            }
+        return results
+
+    @staticmethod
+    def find_regressions(results, budgets, tolerance):
+        regressions = []
+        for name, result in results.items():
+            if result["status"] != result["expected_status"]:
+                regressions.append(
+                    f"{name}: статус {result['status']}, "
+                    f"ожидается {result['expected_status']}"
+                )
+            if result["queries"] > settings.REQUEST_QUERY_BUDGET:
+                regressions.append(
+                    f"{name}: запросов {result['queries']}, "
+                    f"REQUEST_QUERY_BUDGET {settings.REQUEST_QUERY_BUDGET}"
+                )
+            budget = budgets.get(name)
+            if budget is None:
+                continue
+            if result["queries"] > budget["queries"]:
+                regressions.append(
+                    f"{name}: запросов {result['queries']}, "
+                    f"бюджет {budget['queries']}"
+                )
+            for key, unit in (("time_ms", "мс"), ("memory_kb", "КБ")):
+                limit = budget[key] * (1 + tolerance)
+                if result[key] > limit:
+                    regressions.append(
+                        f"{name}: {result[key]} {unit}, "
+                        f"бюджет {budget[key]} {unit}"
+                    )
+        return regressions
+
+    def print_results(self, results, budgets, only):
+        self.stdout.write(
+            f"{'Сценарий':<30}{'Статус':>7}{'Запросы':>12}"
+            f"{'Время, мс':>12}{'Память, КБ':>12}"
+        )
+        for name, result in results.items():
+            if only and name not in only:
+                continue
+            budget = budgets.get(name, {}).get("queries", "-")
+            self.stdout.write(
+                f"{name:<30}{result['status']:>7}"
+                f"{str(result['queries']) + '/' + str(budget):>12}"
+                f"{result['time_ms']:>12}{result['memory_kb']:>12}"
+            )
+
+    def load_budgets(self, path):
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+
+    def write_json(self, path, data):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False, indent=2)
+            file.write("\n")
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat должен быть больше 0")
+        budgets = self.load_budgets(options["budgets"])
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with tempfile.TemporaryDirectory() as media_root:
+                with override_settings(
+                    MEDIA_ROOT=media_root,
+                    CACHES={
+                        "default": {
+                            "BACKEND": "django.core.cache.backends.locmem."
+                            "LocMemCache",
+                            "LOCATION": "benchmark",
+                        }
+                    },
+                ):
+                    self.seed(options)
+                    self.track_image_jobs()
+                    results = self.run_scenarios(options["repeat"])
+                    images.executor.shutdown(wait=True)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        regressions = self.find_regressions(
+            results, budgets, options["tolerance"]
+        )
+        self.print_results(results, budgets, options["only"])
+        if options["report"]:
+            self.write_json(options["report"], {
+                "created": timezone.now().isoformat(),
+                "commit": get_commit(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "dataset": {
+                    key: options[key] for key in ("users", "recipes", "seed")
+                },
+                "results": results,
+                "regressions": regressions,
+            })
+        if options["update_budgets"]:
+            over_limit = [
+                name for name, result in results.items()
+                if result["queries"] > settings.REQUEST_QUERY_BUDGET
+            ]
+            if over_limit:
+                raise CommandError(
+                    "Бюджеты не записаны, REQUEST_QUERY_BUDGET превышен: {}"
+                    .format(", ".join(over_limit))
+                )
+            self.write_json(options["budgets"], {
+                name: {
+                    key: result[key]
+                    for key in ("queries", "time_ms", "memory_kb")
+                }
+                for name, result in results.items()
+            })
+            self.stdout.write(f"Бюджеты записаны в {options['budgets']}")
+            return
+        if regressions:
+            raise CommandError(
+                "Превышены бюджеты:\n" + "\n".join(regressions)
+            )
+        self.stdout.write("Все сценарии укладываются в бюджеты")
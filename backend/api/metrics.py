@@ -0,0 +1,141 @@
+import threading
+from collections import defaultdict
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (
+    256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+)
+
+
+def format_labels(labels):
+    return ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"'),
+        )
+        for name, value in labels
+    )
+
+
+class Counter:
+    """Счетчик в текстовом формате Prometheus"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.values = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] += amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for label_values, value in sorted(values.items()):
+            labels = format_labels(zip(self.label_names, label_values))
+            yield f"{self.name}{{{labels}}} {value}"
+
+
+class Histogram(Counter):
+    """Гистограмма с накопительными корзинами, как в prometheus_client"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label_names, buckets):
+        super().__init__(name, documentation, label_names)
+        self.buckets = buckets
+        self.values = defaultdict(lambda: [0] * (len(buckets) + 2))
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            counts = self.values[label_values]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self.lock:
+            values = {key: list(counts) for key, counts in self.values.items()}
+        for label_values, counts in sorted(values.items()):
+            labels = list(zip(self.label_names, label_values))
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                bucket_labels = format_labels(labels + [("le", bound)])
+                yield f"{self.name}_bucket{{{bucket_labels}}} {count}"
+            labels = format_labels(labels)
+            yield f"{self.name}_sum{{{labels}}} {counts[-1]}"
+            yield f"{self.name}_count{{{labels}}} {counts[-2]}"
+
+
+REQUESTS = Counter(
+    "foodgram_requests_total",
+    "Число запросов по обработчику и статусу ответа",
+    ("view", "status"),
+)
+DURATION = Histogram(
+    "foodgram_request_duration_seconds",
+    "Полное время обработки запроса",
+    ("view",),
+    DURATION_BUCKETS,
+)
+DB_DURATION = Histogram(
+    "foodgram_request_db_seconds",
+    "Суммарное время SQL-запросов за запрос",
+    ("view",),
+    DURATION_BUCKETS,
+)
+SERIALIZE_DURATION = Histogram(
+    "foodgram_request_serialize_seconds",
+    "Время получения serializer.data, включая запросы сериализаторов",
+    ("view",),
+    DURATION_BUCKETS,
+)
+RENDER_DURATION = Histogram(
+    "foodgram_request_render_seconds",
+    "Время рендеринга ответа в JSON рендерером DRF",
+    ("view",),
+    DURATION_BUCKETS,
+)
+QUERIES = Histogram(
+    "foodgram_request_queries",
+    "Число SQL-запросов за запрос",
+    ("view",),
+    QUERY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    "foodgram_response_size_bytes",
+    "Размер тела ответа",
+    ("view",),
+    SIZE_BUCKETS,
+)
+
+METRICS = (
+    REQUESTS,
+    DURATION,
+    DB_DURATION,
+    SERIALIZE_DURATION,
+    RENDER_DURATION,
+    QUERIES,
+    RESPONSE_SIZE,
+)
+
+
+def render_metrics():
+    """Все метрики процесса в текстовом формате Prometheus"""
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,117 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import (DB_DURATION, DURATION, QUERIES, RENDER_DURATION,
+                      REQUESTS, RESPONSE_SIZE, SERIALIZE_DURATION)
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_VIEW = "unknown"
+METRICS_VIEW = "metrics"
+
+
+def get_view_name(view_func, method):
+    """Имя обработчика вида RecipeViewSet.list для вьюсетов DRF"""
+    actions = getattr(view_func, "actions", None)
+    if actions:
+        action = actions.get(method.lower(), method.lower())
+        return f"{view_func.cls.__name__}.{action}"
+    view_class = getattr(view_func, "cls", None) or getattr(
+        view_func, "view_class", None
+    )
+    if view_class is not None:
+        return view_class.__name__
+    return getattr(view_func, "__name__", UNKNOWN_VIEW)
+
+
+class RequestStats:
+    def __init__(self):
+        self.view = UNKNOWN_VIEW
+        self.queries = 0
+        self.db_time = 0
+        self.serialize_time = 0
+        self.render_time = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+def serializer_data(serializer):
+    """serializer.data с учетом времени сериализации в метриках запроса"""
+    started = time.perf_counter()
+    data = serializer.data
+    stats = getattr(serializer.context.get("request"), "metrics", None)
+    if stats is not None:
+        stats.serialize_time += time.perf_counter() - started
+    return data
+
+
+class MetricsMiddleware:
+    """Собирает по каждому обработчику число и время SQL-запросов,
+    время сериализации и рендеринга и размер ответа для эндпоинта
+    метрик."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = request.metrics = RequestStats()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(stats.record_query)
+                )
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        if stats.view != METRICS_VIEW:
+            self.observe(stats, response, duration)
+        if stats.queries > settings.REQUEST_QUERY_BUDGET:
+            logger.warning(
+                "%s %s (%s): %d SQL-запросов при бюджете %d",
+                request.method,
+                request.path,
+                stats.view,
+                stats.queries,
+                settings.REQUEST_QUERY_BUDGET,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics.view = get_view_name(view_func, request.method)
+
+    def process_template_response(self, request, response):
+        """Ответы DRF рендерятся после выхода из view, засекаем рендер"""
+        stats = request.metrics
+        started = time.perf_counter()
+
+        def finish_render(response):
+            stats.render_time += time.perf_counter() - started
+
+        response.add_post_render_callback(finish_render)
+        return response
+
+    @staticmethod
+    def observe(stats, response, duration):
+        REQUESTS.inc(stats.view, response.status_code)
+        DURATION.observe(duration, stats.view)
+        DB_DURATION.observe(stats.db_time, stats.view)
+        SERIALIZE_DURATION.observe(stats.serialize_time, stats.view)
+        RENDER_DURATION.observe(stats.render_time, stats.view)
+        QUERIES.observe(stats.queries, stats.view)
+        if response.has_header("Content-Length"):
+            size = int(response["Content-Length"])
+        elif not response.streaming:
+            size = len(response.content)
+        else:
+            return
+        RESPONSE_SIZE.observe(size, stats.view)
@@ -1,5 +1,101 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomPaginationPageSize(PageNumberPagination):
+    """Постраничная пагинация с параметром limit.
+
+    При наличии параметра cursor включается пагинация по ключу
+    из полей view.cursor_ordering: без подсчета COUNT(*) и OFFSET,
+    поэтому дальние страницы обходятся так же дешево, как первая."""
+
     page_size_query_param = "limit"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Неверный курсор"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.ordering = view.cursor_ordering
+        self.fields = [field.lstrip("-") for field in self.ordering]
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            queryset = queryset.filter(
+                self.get_cursor_filter(self.decode_cursor(cursor, queryset))
+            )
+        page = list(queryset[:page_size + 1])
+        self.next_cursor = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_cursor = self.encode_cursor(page[-1])
+        return page
+
+    def get_cursor_filter(self, position):
+        """Условие «строго после position» в лексикографическом порядке"""
+        conditions = []
+        for i, field in enumerate(self.ordering):
+            name = self.fields[i]
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition = {
+                previous: position[previous] for previous in self.fields[:i]
+            }
+            condition[f"{name}__{lookup}"] = position[name]
+            conditions.append(Q(**condition))
+        return reduce(or_, conditions)
+
+    def encode_cursor(self, instance):
+        values = []
+        for name in self.fields:
+            value = getattr(instance, name)
+            values.append(
+                value.isoformat() if hasattr(value, "isoformat") else value
+            )
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor, queryset):
+        try:
+            values = json.loads(urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.fields):
+                raise ValueError
+            return {
+                name: queryset.model._meta.get_field(name).to_python(value)
+                for name, value in zip(self.fields, values)
+            }
+        except (BinasciiError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(
+            url, self.cursor_query_param, self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("results", data),
+        ]))
@@ -0,0 +1,94 @@
+import gzip
+import hashlib
+import threading
+import time
+
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from recipes.models import Ingredient, Tag
+from rest_framework.renderers import JSONRenderer
+
+from .cache_versions import get_version
+from .serializers import IngredientSerializer, TagSerializer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+
+class SerializedList:
+    """Полный список объектов модели, сериализованный один раз
+    и хранящийся в памяти процесса в сжатом виде"""
+
+    def __init__(self, name, get_queryset, serializer_class):
+        self.name = name
+        self.get_queryset = get_queryset
+        self.serializer_class = serializer_class
+        self._lock = threading.Lock()
+        self._version = None
+        self._digest = None
+        self._bodies = {}
+        self._modified = None
+
+    def _build(self, version):
+        # Реплика может отставать и сохранить под новым поколением
+        # данные до записи, поэтому список строится по основной базе
+        data = self.serializer_class(
+            self.get_queryset().using(DEFAULT_DB_ALIAS), many=True
+        ).data
+        content = JSONRenderer().render(data)
+        bodies = {
+            "identity": content,
+            "gzip": gzip.compress(content),
+        }
+        if brotli is not None:
+            bodies["br"] = brotli.compress(content)
+        self._digest = hashlib.sha256(content).hexdigest()
+        self._bodies = bodies
+        self._modified = int(time.time())
+        self._version = version
+
+    def _ensure_built(self):
+        version = get_version(self.name)
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._build(version)
+
+    def _select_encoding(self, request):
+        header = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        accepted = {value.split(";")[0].strip() for value in header.split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self._bodies:
+                return encoding
+        return "identity"
+
+    def get_response(self, request):
+        self._ensure_built()
+        encoding = self._select_encoding(request)
+        etag = f'"{self._digest}-{encoding}"'
+        response = get_conditional_response(
+            request, etag=etag, last_modified=self._modified
+        )
+        if response is None:
+            response = HttpResponse(
+                self._bodies[encoding], content_type="application/json"
+            )
+            if encoding != "identity":
+                response["Content-Encoding"] = encoding
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(self._modified)
+        response["Cache-Control"] = CACHE_CONTROL
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
+
+ingredients_payload = SerializedList(
+    "ingredients", Ingredient.objects.all, IngredientSerializer
+)
+tags_payload = SerializedList("tags", Tag.objects.all, TagSerializer)
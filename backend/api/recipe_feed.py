@@ -0,0 +1,48 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .cache_versions import bump_version, get_version
+
+VERSION_NAME = "recipes"
+CACHE_KEY = "recipe_feed:{}:{}"
+FEED_PARAMS = frozenset(("author", "cursor", "limit", "page", "tags"))
+
+
+def get_cache_key(request):
+    """Ключ ленты по нормализованной строке запроса.
+
+    Для параметров вне FEED_PARAMS возвращает None: такие запросы
+    обрабатываются без кеша, чтобы не плодить ключи."""
+    params = request.query_params
+    if not FEED_PARAMS.issuperset(params):
+        return None
+    # Пустые значения тоже входят в ключ: пустой cursor включает
+    # постраничный вывод по курсору
+    query = "&".join(
+        f"{name}={value}"
+        for name in sorted(params)
+        for value in sorted(set(params.getlist(name)))
+    )
+    # Ссылки на страницы и изображения абсолютные, поэтому хост в ключе
+    url = f"{request.scheme}://{request.get_host()}{request.path}?{query}"
+    digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return CACHE_KEY.format(get_version(VERSION_NAME), digest)
+
+
+def get_cached_feed(key):
+    """Данные страницы, ее ETag и время изменения или None"""
+    return cache.get(key)
+
+
+def set_cached_feed(key, data, etag, modified):
+    cache.set(
+        key, (data, etag, modified), settings.RECIPE_FEED_CACHE_TIMEOUT
+    )
+
+
+def invalidate_feed():
+    """Сбрасывает все страницы ленты после фиксации транзакции"""
+    transaction.on_commit(lambda: bump_version(VERSION_NAME))
@@ -1,14 +1,27 @@
+from collections import OrderedDict
+
 import webcolors
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Manager, Prefetch, prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
+from recipes.images import schedule_image_processing
 from recipes.models import (AmountIngredientRecipe, Cart, Favorites,
-                            Ingredient, Recipe, Tag)
+                            Ingredient, Recipe, RecipeImageVariant,
+                            ShoppingListItem, Tag)
 from rest_framework import serializers
 from users.models import Follow
 
+from .cache_versions import get_version
+from .shopping_list import invalidate_shopping_lists
+
 User = get_user_model()
 
+FRAGMENT_CACHE_KEY = "recipe_fragment:{}:{}:{}:{}:{}"
+
 
 class Hex2NameColor(serializers.Field):
     """Для представления цвета в формате HEX"""
@@ -114,16 +127,54 @@ class UserCustomSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         user = self.context.get("request").user
         if user.is_anonymous:
             return False
         return Follow.objects.filter(user=user, author=obj).exists()
 
 
+class ImageVariantsField(serializers.Field):
+    """Ссылки на готовые варианты изображения рецепта"""
+
+    def __init__(self, **kwargs):
+        kwargs["source"] = "image_variants.all"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get("request")
+        variants = {}
+        for variant in value:
+            url = variant.image.url
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            variants[variant.kind] = url
+        return variants
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Загружает фрагменты всей страницы рецептов одним обращением
+    к кешу"""
+
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        self.child.load_fragments(recipes)
+        return [self.child.to_representation(recipe) for recipe in recipes]
+
+
 class RecipeSerializer(serializers.ModelSerializer):
-    """Для представления одного или более рецептов"""
+    """Для представления одного или более рецептов.
+
+    Поля, одинаковые для всех пользователей, кешируются фрагментом
+    по id и updated_at рецепта. Автор и флаги пользователя
+    сериализуются при каждом запросе."""
+
+    live_fields = ("author", "is_favorited", "is_in_shopping_cart")
 
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
 
     author = UserCustomSerializer(read_only=True, many=False)
     tags = TagSerializer(read_only=True, many=True)
@@ -133,19 +184,101 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        fields = "__all__"
+        exclude = ("updated_at",)
+        list_serializer_class = RecipeListSerializer
+
+    def get_fragment_keys(self, recipes):
+        request = self.context.get("request")
+        base_url = request.build_absolute_uri("/") if request else ""
+        ingredients_version = get_version("ingredients")
+        tags_version = get_version("tags")
+        return {
+            recipe.pk: FRAGMENT_CACHE_KEY.format(
+                recipe.pk,
+                recipe.updated_at.timestamp(),
+                ingredients_version,
+                tags_version,
+                base_url,
+            )
+            for recipe in recipes
+        }
+
+    def to_fragment(self, recipe):
+        fragment = {}
+        for field in self._readable_fields:
+            if field.field_name in self.live_fields:
+                continue
+            attribute = field.get_attribute(recipe)
+            fragment[field.field_name] = (
+                None if attribute is None
+                else field.to_representation(attribute)
+            )
+        return fragment
+
+    def load_fragments(self, recipes):
+        """Берет фрагменты из кеша, недостающие строит по связанным
+        данным, загруженным для всех таких рецептов сразу"""
+        keys = self.get_fragment_keys(recipes)
+        fragments = cache.get_many(keys.values())
+        missing = [
+            recipe for recipe in recipes if keys[recipe.pk] not in fragments
+        ]
+        if missing:
+            # Фрагменты хранятся под текущими поколениями тегов и
+            # ингредиентов, поэтому строятся по основной базе, а не
+            # по отстающей реплике
+            prefetch_related_objects(
+                missing,
+                Prefetch("tags", queryset=Tag.objects.using(DEFAULT_DB_ALIAS)),
+                Prefetch(
+                    "image_variants",
+                    queryset=RecipeImageVariant.objects.using(
+                        DEFAULT_DB_ALIAS
+                    ),
+                ),
+                Prefetch(
+                    "amount",
+                    queryset=AmountIngredientRecipe.objects.using(
+                        DEFAULT_DB_ALIAS
+                    ).select_related("ingredient"),
+                ),
+            )
+            built = {
+                keys[recipe.pk]: self.to_fragment(recipe) for recipe in missing
+            }
+            cache.set_many(built, settings.RECIPE_FRAGMENT_CACHE_TIMEOUT)
+            fragments.update(built)
+        for recipe in recipes:
+            recipe.fragment = fragments[keys[recipe.pk]]
+
+    def to_representation(self, instance):
+        if not hasattr(instance, "fragment"):
+            self.load_fragments([instance])
+        representation = OrderedDict()
+        for field in self._readable_fields:
+            name = field.field_name
+            if name in self.live_fields:
+                representation[name] = field.to_representation(
+                    field.get_attribute(instance)
+                )
+            else:
+                representation[name] = instance.fragment[name]
+        return representation
 
     def get_ingredients(self, obj):
-        queryset = AmountIngredientRecipe.objects.filter(recipe=obj)
-        return IngredientAmountSerializer(queryset, many=True).data
+        return IngredientAmountSerializer(obj.amount.all(), many=True).data
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, "is_favorited"):
+            return obj.is_favorited
         request = self.context.get("request")
         if not request or request.user.is_anonymous:
             return False
         return obj.favorites.filter(user=request.user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, "is_in_shopping_cart"):
+            return obj.is_in_shopping_cart
         request = self.context.get("request")
         if not request or request.user.is_anonymous:
             return False
@@ -155,9 +288,11 @@ class RecipeSerializer(serializers.ModelSerializer):
 class RecipeSerializerShort(serializers.ModelSerializer):
     """Серилизатор для частичной выдачи полей рецепта"""
 
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "image_variants", "cooking_time")
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
@@ -182,10 +317,13 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             "image",
         )
 
-    @staticmethod
-    def create_tags(tags, recipe):
-        for tag in tags:
-            recipe.tags.add(tag)
+    def validate_ingredients(self, ingredients):
+        ingredient_ids = [ingredient["id"].id for ingredient in ingredients]
+        if len(ingredient_ids) != len(set(ingredient_ids)):
+            raise serializers.ValidationError(
+                "Ингредиенты не должны повторяться"
+            )
+        return ingredients
 
     @staticmethod
     def create_ingredients(ingredients, recipe):
@@ -199,13 +337,52 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         ]
         AmountIngredientRecipe.objects.bulk_create(ingredients_list)
 
+    @staticmethod
+    def update_ingredients(ingredients, recipe):
+        """Применяет к составу рецепта только изменившиеся количества.
+        Возвращает старые и новые количества по id ингредиентов"""
+        existing = {
+            amount.ingredient_id: amount
+            for amount in AmountIngredientRecipe.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: amount.amount
+            for ingredient_id, amount in existing.items()
+        }
+        new_amounts = {
+            ingredient["id"].id: ingredient["amount"]
+            for ingredient in ingredients
+        }
+        to_create, to_update = [], []
+        for ingredient_id, amount in new_amounts.items():
+            current = existing.get(ingredient_id)
+            if current is None:
+                to_create.append(AmountIngredientRecipe(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=amount
+                ))
+            elif current.amount != amount:
+                current.amount = amount
+                to_update.append(current)
+        to_delete = [
+            amount.pk
+            for ingredient_id, amount in existing.items()
+            if ingredient_id not in new_amounts
+        ]
+        if to_delete:
+            AmountIngredientRecipe.objects.filter(pk__in=to_delete).delete()
+        AmountIngredientRecipe.objects.bulk_update(to_update, ["amount"])
+        AmountIngredientRecipe.objects.bulk_create(to_create)
+        return old_amounts, new_amounts
+
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get("request").user
         tags = validated_data.pop("tags")
         ingredients = validated_data.pop("ingredients")
         recipe = Recipe.objects.create(author=author, **validated_data)
         self.create_ingredients(ingredients, recipe)
-        self.create_tags(tags, recipe)
+        recipe.tags.set(tags)
+        schedule_image_processing(recipe)
         return recipe
 
     def to_representation(self, instance):
@@ -213,12 +390,28 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         context = {"request": request}
         return RecipeSerializer(instance, context=context).data
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        AmountIngredientRecipe.objects.filter(recipe=instance).delete()
-        self.create_tags(validated_data.pop("tags"), instance)
-        self.create_ingredients(validated_data.pop("ingredients"), instance)
-        return super().update(instance, validated_data)
+        if "tags" in validated_data:
+            instance.tags.set(validated_data.pop("tags"))
+        if "ingredients" in validated_data:
+            old_amounts, new_amounts = self.update_ingredients(
+                validated_data.pop("ingredients"), instance
+            )
+            if old_amounts != new_amounts:
+                ShoppingListItem.objects.change_recipe(
+                    instance.id, old_amounts, new_amounts
+                )
+                invalidate_shopping_lists(
+                    Cart.objects.filter(recipe=instance).values_list(
+                        "user_id", flat=True
+                    )
+                )
+        old_image = instance.image.name
+        instance = super().update(instance, validated_data)
+        if instance.image.name != old_image:
+            schedule_image_processing(instance)
+        return instance
 
 
 class CartSerializer(serializers.ModelSerializer):
@@ -266,18 +459,26 @@ class FollowCreateSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         user = self.context.get("request").user
         if user.is_anonymous:
             return False
         return Follow.objects.filter(user=user, author=obj).exists()
 
     def get_recipes(self, obj):
+        if hasattr(obj, "recipes_preview"):
+            return RecipeSerializerShort(obj.recipes_preview, many=True).data
         request = self.context.get("request")
         limit = request.GET.get("recipes_limit")
-        recipes = Recipe.objects.filter(author=obj)
+        recipes = Recipe.objects.filter(author=obj).prefetch_related(
+            "image_variants"
+        )
         if limit:
             recipes = recipes[: int(limit)]
         return RecipeSerializerShort(recipes, many=True).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, "recipes_count"):
+            return obj.recipes_count
         return obj.recipes.count()
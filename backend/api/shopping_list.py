@@ -0,0 +1,190 @@
+import csv
+import hashlib
+import json
+import os
+import tempfile
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from recipes.models import ShoppingListItem
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from .cache_versions import bump_version, get_version
+
+FONT = "Roboto-Regular"
+FONT_PATH = os.path.join(settings.BASE_DIR, "data", "Roboto-Regular.ttf")
+
+TOP_MARGIN = 800
+BOTTOM_MARGIN = 50
+LINE_HEIGHT = 20
+SPOOL_MAX_SIZE = 1024 * 1024
+
+CACHE_PREFIX = "shopping_list"
+
+
+def get_shopping_list(user):
+    """Читает суммы ингредиентов из таблицы списков покупок"""
+    return (
+        ShoppingListItem.objects.filter(user=user)
+        .values(
+            "ingredient__name",
+            "ingredient__measurement_unit",
+            total=F("amount"),
+        )
+        .order_by("ingredient__name", "ingredient__measurement_unit")
+    )
+
+
+def format_line(number, item):
+    return (
+        f"""{number}. {item["ingredient__name"]} - {item["total"]}"""
+        f"""{item["ingredient__measurement_unit"]}"""
+    )
+
+
+@lru_cache(maxsize=None)
+def register_font():
+    """Регистрирует шрифт один раз за время жизни процесса"""
+    pdfmetrics.registerFont(TTFont(FONT, FONT_PATH, "UTF-8"))
+    return FONT
+
+
+def render_pdf(items):
+    """Формирует многостраничный PDF со списком покупок.
+
+    Документ пишется во временный файл, который хранится в памяти,
+    пока не превысит SPOOL_MAX_SIZE."""
+    font = register_font()
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    page = canvas.Canvas(output)
+    page.setFont(font, size=24)
+    page.drawString(180, 750, "Список покупок")
+    page.setFont(font, size=16)
+    height = 600
+    for i, item in enumerate(items, 1):
+        if height < BOTTOM_MARGIN:
+            page.showPage()
+            page.setFont(font, size=16)
+            height = TOP_MARGIN
+        page.drawString(70, height, format_line(i, item))
+        height -= LINE_HEIGHT
+    page.showPage()
+    page.save()
+    output.seek(0)
+    return output
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(("name", "measurement_unit", "amount"))
+    for item in items:
+        yield writer.writerow((
+            item["ingredient__name"],
+            item["ingredient__measurement_unit"],
+            item["total"],
+        ))
+
+
+def stream_txt(items):
+    yield "Список покупок\n\n"
+    for i, item in enumerate(items, 1):
+        yield format_line(i, item) + "\n"
+
+
+def stream_json(items):
+    separator = ""
+    yield "["
+    for item in items:
+        yield separator + json.dumps(
+            {
+                "name": item["ingredient__name"],
+                "measurement_unit": item["ingredient__measurement_unit"],
+                "amount": item["total"],
+            },
+            ensure_ascii=False,
+        )
+        separator = ", "
+    yield "]"
+
+
+STREAM_FORMATS = {
+    "csv": (stream_csv, "text/csv; charset=utf-8"),
+    "txt": (stream_txt, "text/plain; charset=utf-8"),
+    "json": (stream_json, "application/json"),
+}
+
+
+def user_version_name(user_id):
+    return f"{CACHE_PREFIX}:{user_id}"
+
+
+def user_cache_key(user_id):
+    """Ключ хеша списка на текущем поколении корзины пользователя"""
+    version = get_version(user_version_name(user_id))
+    return f"{CACHE_PREFIX}:user:{user_id}:{version}"
+
+
+def document_cache_key(digest):
+    return f"{CACHE_PREFIX}:pdf:{digest}"
+
+
+def get_digest(items):
+    """Хеш содержимого списка покупок"""
+    data = json.dumps(items, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def get_cached_digest(user):
+    """Хеш последнего сформированного списка, если корзина не менялась"""
+    return cache.get(user_cache_key(user.id))
+
+
+def get_shopping_list_document(user):
+    """Возвращает хеш и PDF списка покупок.
+
+    Документ хранится в кеше по хешу содержимого корзины, поэтому
+    одинаковые списки не перерисовываются повторно."""
+    timeout = settings.SHOPPING_LIST_CACHE_TIMEOUT
+    # Поколение читается до списка: если корзина изменится раньше,
+    # чем хеш будет сохранен, он попадет под устаревший ключ
+    key = user_cache_key(user.id)
+    digest = cache.get(key)
+    if digest is not None:
+        content = cache.get(document_cache_key(digest))
+        if content is not None:
+            return digest, content
+    items = list(get_shopping_list(user))
+    digest = get_digest(items)
+    content = cache.get(document_cache_key(digest))
+    if content is None:
+        with render_pdf(items) as output:
+            content = output.read()
+        cache.set(document_cache_key(digest), content, timeout)
+    cache.set(key, digest, timeout)
+    return digest, content
+
+
+def invalidate_shopping_lists(user_ids):
+    """Меняет поколения корзин пользователей после фиксации транзакции.
+
+    Выгрузка, прочитавшая список до изменения, сохранит хеш под ключом
+    прежнего поколения, и он больше не будет отдан"""
+    user_ids = list(user_ids)
+
+    def bump_versions():
+        for user_id in user_ids:
+            bump_version(user_version_name(user_id))
+
+    transaction.on_commit(bump_versions)
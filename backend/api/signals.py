@@ -0,0 +1,125 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+from recipes.models import (AmountIngredientRecipe, Cart, Ingredient, Recipe,
+                            RecipeImageVariant, ShoppingListItem, Tag)
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_user_tokens
+from .cache_versions import bump_version
+from .recipe_feed import invalidate_feed
+from .shopping_list import invalidate_shopping_lists
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Cart)
+@receiver(post_delete, sender=Cart)
+def invalidate_cart_owner(sender, instance, **kwargs):
+    invalidate_shopping_lists([instance.user_id])
+
+
+@receiver(post_save, sender=Cart)
+def add_to_shopping_list(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ShoppingListItem.objects.add_recipe(
+            instance.user_id, instance.recipe_id
+        )
+
+
+@receiver(pre_delete, sender=Cart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    """Срабатывает и при каскадном удалении из админки: состав
+    рецепта еще не удален, поскольку pre_delete отправляется
+    до удаления всех собранных объектов"""
+    ShoppingListItem.objects.remove_recipe(
+        instance.user_id, instance.recipe_id
+    )
+
+
+@receiver(post_save, sender=AmountIngredientRecipe)
+@receiver(post_delete, sender=AmountIngredientRecipe)
+def invalidate_recipe_carts(sender, instance, **kwargs):
+    invalidate_shopping_lists(
+        Cart.objects.filter(recipe_id=instance.recipe_id).values_list(
+            "user_id", flat=True
+        )
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    bump_version("ingredients")
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    bump_version("tags")
+
+
+@receiver(post_delete, sender=Token)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_auth(sender, instance, **kwargs):
+    """Выход, смена пароля и блокировка удаляют токены из кеша"""
+    if sender is Token:
+        user_id, keys = instance.user_id, [instance.key]
+    elif settings.AUTH_TOKEN_SHARED_CACHE:
+        user_id = instance.pk
+        keys = list(
+            Token.objects.filter(user_id=user_id).values_list("key", flat=True)
+        )
+    else:
+        user_id, keys = instance.pk, []
+    transaction.on_commit(lambda: invalidate_user_tokens(user_id, keys))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(post_save, sender=AmountIngredientRecipe)
+@receiver(post_delete, sender=AmountIngredientRecipe)
+@receiver(post_save, sender=RecipeImageVariant)
+@receiver(post_delete, sender=RecipeImageVariant)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_recipe_feed(sender, **kwargs):
+    invalidate_feed()
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_feed(sender, instance, update_fields=None, **kwargs):
+    """Вход пользователя меняет только last_login, рецепты от него
+    не зависят"""
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    invalidate_feed()
+
+
+def touch_recipes(recipes):
+    """Обновляет updated_at рецептов, чье представление изменилось
+    без сохранения самого рецепта"""
+    recipes.update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipe_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        touch_recipes(Recipe.objects.filter(pk=instance.pk))
+    elif pk_set:
+        touch_recipes(Recipe.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=AmountIngredientRecipe)
+def touch_recipe_amounts(sender, instance, **kwargs):
+    touch_recipes(Recipe.objects.filter(pk=instance.recipe_id))
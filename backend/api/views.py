@@ -1,43 +1,289 @@
+from functools import partial
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import (BooleanField, Count, Exists, F, Max, OuterRef,
+                              Prefetch, Value, Window,
+                              prefetch_related_objects)
+from django.db.models.functions import RowNumber
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from recipes.models import (AmountIngredientRecipe, Cart, Favorites,
-                            Ingredient, Recipe, Tag)
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
+from foodgram.replicas import is_pinned, release_replica, use_replica
+from recipes.models import Cart, Favorites, Ingredient, Recipe, Tag
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import (IsAuthenticated,
+from rest_framework.permissions import (SAFE_METHODS, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 from users.models import Follow
 
-from .filters import IngredientSearchFilter, RecipeFilter
+from .cache_versions import get_version, get_version_time
+from .conditional import conditional_response, latest, make_etag
+from .filters import RecipeFilter
+from .ingredient_index import ingredient_index
+from .metrics import CONTENT_TYPE, render_metrics
+from .middleware import serializer_data
+from .negotiation import IgnoreFormatContentNegotiation
 from .paginator import CustomPaginationPageSize
+from .payloads import ingredients_payload, tags_payload
 from .permissions import IsAuthorOrReadOnly
+from .recipe_feed import get_cache_key, get_cached_feed, set_cached_feed
 from .serializers import (CartSerializer, FavoritesSerializer,
                           FollowCreateSerializer, IngredientSerializer,
                           RecipeCreateSerializer, RecipeSerializer,
                           TagSerializer)
+from .shopping_list import (STREAM_FORMATS, get_cached_digest,
+                            get_shopping_list, get_shopping_list_document)
 
 User = get_user_model()
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+def annotate_is_subscribed(queryset, user):
+    """Добавляет к выборке пользователей флаг подписки на них"""
+    if user.is_anonymous:
+        return queryset.annotate(
+            is_subscribed=Value(False, output_field=BooleanField())
+        )
+    return queryset.annotate(
+        is_subscribed=Exists(
+            Follow.objects.filter(user=user, author=OuterRef("pk"))
+        )
+    )
+
+
+def get_recipes_limit(request):
+    limit = request.GET.get("recipes_limit")
+    if limit:
+        return int(limit)
+    return None
+
+
+def attach_recipes_preview(authors, limit=None):
+    """Загружает рецепты для всех авторов страницы одним запросом,
+    ограничивая число рецептов каждого автора через ROW_NUMBER()"""
+    authors = list(authors)
+    if not authors:
+        return authors
+    recipes = Recipe.objects.filter(author__in=authors)
+    if limit is not None:
+        recipes = recipes.annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F("author_id")],
+                order_by=[F("publication_date").desc(), F("id").desc()],
+            )
+        )
+        # SQL строится для той базы, на которой выполнится запрос
+        alias = recipes.db
+        sql, params = recipes.query.get_compiler(using=alias).as_sql()
+        recipes = Recipe.objects.using(alias).raw(
+            f"SELECT * FROM ({sql}) ranked WHERE row_number <= %s "
+            "ORDER BY row_number",
+            params + (limit,),
+        )
+    recipes = list(recipes)
+    prefetch_related_objects(recipes, "image_variants")
+    previews = {author.id: [] for author in authors}
+    for recipe in recipes:
+        previews[recipe.author_id].append(recipe)
+    for author in authors:
+        author.recipes_preview = previews[author.id]
+    return authors
+
+
+class ReplicaReadMixin:
+    """Действия из replica_actions читают данные с реплики, если
+    пользователь недавно ничего не менял."""
+
+    replica_actions = ("list", "retrieve")
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method not in SAFE_METHODS:
+            return
+        if self.action in self.replica_actions and not is_pinned(request.user):
+            use_replica()
+
+
+class SerializationMetricsMixin:
+    """list и retrieve DRF, учитывающие время serializer.data
+    в метриках запроса"""
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                serializer_data(self.get_serializer(page, many=True))
+            )
+        return Response(
+            serializer_data(self.get_serializer(queryset, many=True))
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(
+            serializer_data(self.get_serializer(self.get_object()))
+        )
+
+
+class RecipeViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     filterset_class = RecipeFilter
     filter_backends = [DjangoFilterBackend]
     pagination_class = CustomPaginationPageSize
     permission_classes = [IsAuthorOrReadOnly]
+    cursor_ordering = ("-publication_date", "-id")
+    author_fields = ("email", "username", "first_name", "last_name")
+
+    def get_queryset(self):
+        """Флаги пользователя и поля автора без связанных объектов:
+        по этой выборке условный GET отвечает 304 до сериализации"""
+        user = self.request.user
+        queryset = Recipe.objects.annotate(**{
+            f"author_{name}": F(f"author__{name}")
+            for name in self.author_fields
+        })
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+                author_is_subscribed=Value(
+                    False, output_field=BooleanField()
+                ),
+            )
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorites.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                Cart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            author_is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef("author_id"))
+            ),
+        )
 
     def get_serializer_class(self):
         if self.action in ("list", "retrieve"):
             return RecipeSerializer
         return RecipeCreateSerializer
 
+    def get_recipe_state(self, recipe):
+        return (
+            recipe.id,
+            recipe.updated_at,
+            recipe.is_favorited,
+            recipe.is_in_shopping_cart,
+            recipe.author_is_subscribed,
+            [getattr(recipe, f"author_{name}") for name in self.author_fields],
+        )
+
+    @staticmethod
+    def get_etag(request, *state):
+        """Теги и ингредиенты рецептов меняются вместе с поколениями
+        данных, а не с updated_at"""
+        return make_etag(
+            request.build_absolute_uri(),
+            get_version("tags"),
+            get_version("ingredients"),
+            *state,
+        )
+
+    @staticmethod
+    def get_last_modified(*updated):
+        """Последнее изменение рецептов с учетом поколений тегов
+        и ингредиентов"""
+        return latest(
+            *updated,
+            get_version_time("tags"),
+            get_version_time("ingredients"),
+        )
+
+    def serialize_recipes(self, recipes, many=False):
+        """Загружает авторов, остальное RecipeSerializer берет
+        из кеша фрагментов"""
+        prefetch_related_objects(
+            recipes if many else [recipes],
+            Prefetch(
+                "author",
+                queryset=annotate_is_subscribed(
+                    User.objects.all(), self.request.user
+                ),
+            ),
+        )
+        return serializer_data(self.get_serializer(recipes, many=many))
+
+    def list(self, request, *args, **kwargs):
+        """Лента с ETag. Для анонимных пользователей она отдается
+        из кеша: флаги избранного, корзины и подписок у них ложны.
+        ETag страницы хранится вместе с ней и меняется при ее
+        перестроении"""
+        key = None if request.user.is_authenticated else get_cache_key(
+            request
+        )
+        if key is None:
+            return conditional_response(request, *self.get_page(request))
+        cached = get_cached_feed(key)
+        if cached is not None:
+            data, etag, modified = cached
+            return conditional_response(
+                request, lambda: Response(data), etag, modified
+            )
+        # Страница для кеша читается с основной базы: отстающая реплика
+        # сохранила бы под новым поколением данные до записи
+        release_replica()
+        get_response, etag, modified = self.get_page(request)
+
+        def get_cached_response():
+            response = get_response()
+            set_cached_feed(key, response.data, etag, modified)
+            return response
+
+        return conditional_response(
+            request, get_cached_response, etag, modified
+        )
+
+    def get_page(self, request):
+        """Страница ленты с флагами пользователя, ее ETag и время
+        последнего изменения. Состав ленты меняется вместе
+        с поколением рецептов"""
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset())
+        )
+        if self.paginator.cursor_mode:
+            position = self.paginator.next_cursor
+        else:
+            position = self.paginator.page.paginator.count
+        etag = self.get_etag(
+            request,
+            position,
+            [self.get_recipe_state(recipe) for recipe in page],
+        )
+        return (
+            lambda: self.get_paginated_response(
+                self.serialize_recipes(page, many=True)
+            ),
+            etag,
+            self.get_last_modified(
+                get_version_time("recipes"),
+                *(recipe.updated_at for recipe in page),
+            ),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        return conditional_response(
+            request,
+            lambda: Response(self.serialize_recipes(recipe)),
+            self.get_etag(request, self.get_recipe_state(recipe)),
+            self.get_last_modified(recipe.updated_at),
+        )
+
     @action(
         detail=True,
         methods=["POST"],
@@ -47,64 +293,65 @@ class RecipeViewSet(viewsets.ModelViewSet):
         data = {"user": request.user.id, "recipe": pk}
         serializer = CartSerializer(data=data, context={"request": request})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        # Список покупок дополняет сигнал сохранения корзины
+        with transaction.atomic():
+            serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @shopping_cart.mapping.delete
     def delete_shopping_cart(self, request, pk):
         user = request.user
         recipe = get_object_or_404(Recipe, id=pk)
-        model_obj = get_object_or_404(Cart, user=user, recipe=recipe)
-        model_obj.delete()
+        # Блокировка строки: при двойном запросе второй не найдет
+        # корзину и не вычтет рецепт из списка покупок повторно
+        with transaction.atomic():
+            model_obj = get_object_or_404(
+                Cart.objects.select_for_update(), user=user, recipe=recipe
+            )
+            model_obj.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @action(detail=False, permission_classes=[IsAuthenticated])
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        content_negotiation_class=IgnoreFormatContentNegotiation,
+    )
     def download_shopping_cart(self, request):
-        shopping_dict = {}
-        font = "Roboto-Regular"
-        ingredients = AmountIngredientRecipe.objects.filter(
-            recipe__cart__user=request.user
-        ).values_list(
-            "ingredient__name",
-            "ingredient__measurement_unit",
-            "amount"
-        )
-        for item in ingredients:
-            name, measurement_unit, amount = item
-            if name not in shopping_dict:
-                shopping_dict[name] = {
-                    "measurement_unit": measurement_unit,
-                    "amount": amount,
-                }
-            else:
-                shopping_dict[name]["amount"] += amount
-
-        pdfmetrics.registerFont(TTFont(
-            font,
-            "data/Roboto-Regular.ttf",
-            "UTF-8"
-        ))
-        response = HttpResponse(content_type="application/pdf")
-        response["Content-Disposition"] = ("attachment; "
-                                           'filename="shopping_list.pdf"'
-                                           )
-        page = canvas.Canvas(response)
-        page.setFont(font, size=24)
-        page.drawString(180, 750, "Список покупок")
-        page.setFont(font, size=16)
-        height = 600
-        for i, (name, data) in enumerate(shopping_dict.items(), 1):
-            page.drawString(
-                70,
-                height,
-                (
-                    f"""{i}. {name} - {data["amount"]}"""
-                    f"""{data["measurement_unit"]}"""
-                ),
+        export_format = request.query_params.get("format", "pdf")
+        if export_format == "pdf":
+            return self.download_shopping_cart_pdf(request)
+        if export_format not in STREAM_FORMATS:
+            return Response(
+                {"errors": "Неподдерживаемый формат списка покупок"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            height -= 20
-        page.showPage()
-        page.save()
+        stream, content_type = STREAM_FORMATS[export_format]
+        response = StreamingHttpResponse(
+            stream(get_shopping_list(request.user).iterator()),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="shopping_list.{export_format}"'
+        )
+        return response
+
+    @staticmethod
+    def download_shopping_cart_pdf(request):
+        digest = get_cached_digest(request.user)
+        if digest is not None:
+            response = get_conditional_response(request, etag=f'"{digest}"')
+            if response is not None:
+                return response
+        digest, content = get_shopping_list_document(request.user)
+        etag = f'"{digest}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content, content_type="application/pdf")
+            response["Content-Disposition"] = (
+                'attachment; filename="shopping_list.pdf"'
+            )
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
         return response
 
     @action(
@@ -131,8 +378,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class UserCustomViewSet(UserViewSet):
+class UserCustomViewSet(SerializationMetricsMixin, UserViewSet):
     permission_classes = [IsAuthenticatedOrReadOnly]
+    cursor_ordering = ("-id",)
 
     @action(
         detail=True,
@@ -156,10 +404,14 @@ class UserCustomViewSet(UserViewSet):
                 {"errors": "Подписка не была создана"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        author.is_subscribed = True
         serializer = FollowCreateSerializer(
-            instance.author, context={"request": request}
+            attach_recipes_preview([author], get_recipes_limit(request))[0],
+            context={"request": request},
+        )
+        return Response(
+            serializer_data(serializer), status=status.HTTP_201_CREATED
         )
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
     def delete_subscribe(self, request, id=None):
@@ -174,38 +426,119 @@ class UserCustomViewSet(UserViewSet):
         instance.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @action(detail=False, permission_classes=[IsAuthenticated])
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=CustomPaginationPageSize,
+    )
     def subscriptions(self, request):
-        following_authors = User.objects.filter(
-            author_to_follow__user=self.request.user
+        limit = get_recipes_limit(request)
+        following_authors = annotate_is_subscribed(
+            User.objects.filter(author_to_follow__user=self.request.user),
+            request.user,
+        ).annotate(
+            recipes_count=Count("recipes"),
+            recipes_updated_at=Max("recipes__updated_at"),
+        ).order_by(*self.cursor_ordering)
+        page = self.paginate_queryset(following_authors)
+        if self.paginator.cursor_mode:
+            position = self.paginator.next_cursor
+        else:
+            position = self.paginator.page.paginator.count
+        etag = make_etag(
+            request.build_absolute_uri(),
+            position,
+            [
+                (
+                    author.id,
+                    author.email,
+                    author.username,
+                    author.first_name,
+                    author.last_name,
+                    author.recipes_count,
+                    author.recipes_updated_at,
+                )
+                for author in page
+            ],
         )
 
-        page = self.paginate_queryset(following_authors)
-        if page is not None:
+        def get_response():
             serializer = FollowCreateSerializer(
-                page, many=True, context={"request": request}
+                attach_recipes_preview(page, limit),
+                many=True,
+                context={"request": request},
             )
-            return self.get_paginated_response(serializer.data)
+            return self.get_paginated_response(serializer_data(serializer))
 
-        serializer = FollowCreateSerializer(
-            following_authors, many=True, context={"request": request}
+        return conditional_response(
+            request,
+            get_response,
+            etag,
+            latest(*(author.recipes_updated_at for author in page)),
+        )
+
+
+class VersionedRetrieveMixin:
+    """ETag объекта справочника по поколению данных version_name:
+    повторный запрос получает 304 без обращения к базе"""
+
+    version_name = None
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(
+            request,
+            partial(super().retrieve, request, *args, **kwargs),
+            make_etag(
+                self.version_name, get_version(self.version_name), kwargs
+            ),
         )
-        return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(
+    VersionedRetrieveMixin,
+    SerializationMetricsMixin,
+    ReplicaReadMixin,
+    viewsets.ModelViewSet,
+):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = [IngredientSearchFilter]
-    search_fields = ("^name",)
+    pagination_class = None
+    version_name = "ingredients"
 
-    def get_paginated_response(self, data):
-        return Response(data)
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get("name")
+        if not name:
+            return ingredients_payload.get_response(request)
+        return conditional_response(
+            request,
+            lambda: Response(ingredient_index.search(
+                name, settings.INGREDIENT_SEARCH_LIMIT
+            )),
+            make_etag(
+                self.version_name,
+                get_version(self.version_name),
+                name,
+                settings.INGREDIENT_SEARCH_LIMIT,
+            ),
+        )
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(
+    VersionedRetrieveMixin,
+    SerializationMetricsMixin,
+    ReplicaReadMixin,
+    viewsets.ModelViewSet,
+):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    pagination_class = None
+    version_name = "tags"
+
+    def list(self, request, *args, **kwargs):
+        return tags_payload.get_response(request)
+
 
-    def get_paginated_response(self, data):
-        return Response(data)
+@require_safe
+def metrics(request):
+    """Метрики процесса для Prometheus"""
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
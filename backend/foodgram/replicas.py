@@ -0,0 +1,117 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+PIN_CACHE_KEY = "replica_pin:{}"
+
+state = threading.local()
+
+
+def use_replica():
+    """Направляет чтения текущего запроса на одну из реплик"""
+    if settings.REPLICA_DATABASES:
+        state.replica = random.choice(settings.REPLICA_DATABASES)
+
+
+def release_replica():
+    state.replica = None
+
+
+def pin_user(user_id):
+    """Оставляет чтения пользователя на основной базе, пока реплики
+    догоняют его изменения"""
+    cache.set(
+        PIN_CACHE_KEY.format(user_id), True, settings.REPLICA_PIN_TIMEOUT
+    )
+
+
+def is_pinned(user):
+    return user.is_authenticated and bool(
+        cache.get(PIN_CACHE_KEY.format(user.pk))
+    )
+
+
+def use_alias(alias):
+    if not hasattr(state, "used_aliases"):
+        state.used_aliases = set()
+    state.used_aliases.add(alias)
+    return alias
+
+
+def check_connections():
+    """Закрывает сохраненные соединения, которые перестали отвечать.
+
+    Проверяются только соединения, не использованные и не проверенные
+    за последние CONN_HEALTH_CHECK_INTERVAL секунд."""
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        checked_at = getattr(connection, "health_checked_at", 0)
+        if now - checked_at < settings.CONN_HEALTH_CHECK_INTERVAL:
+            continue
+        if connection.is_usable():
+            connection.health_checked_at = now
+        else:
+            connection.close()
+
+
+def mark_used_connections():
+    """Соединения, через которые прошел запрос, не нуждаются
+    в проверке до истечения CONN_HEALTH_CHECK_INTERVAL"""
+    now = time.monotonic()
+    for alias in getattr(state, "used_aliases", ()):
+        connections[alias].health_checked_at = now
+    state.used_aliases = set()
+
+
+class ReplicaRouter:
+    """Чтение с реплики только там, где его включил use_replica,
+    любая запись возвращает запрос на основную базу."""
+
+    def db_for_read(self, model, **hints):
+        return use_alias(getattr(state, "replica", None) or DEFAULT_DB_ALIAS)
+
+    def db_for_write(self, model, **hints):
+        release_replica()
+        return use_alias(DEFAULT_DB_ALIAS)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """Проверяет постоянные соединения перед запросом, сбрасывает выбор
+    реплики после него и закрепляет за основной базой пользователей,
+    которые только что изменили данные."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if settings.CONN_HEALTH_CHECKS:
+            check_connections()
+        try:
+            response = self.get_response(request)
+        finally:
+            release_replica()
+            if settings.CONN_HEALTH_CHECKS:
+                mark_used_connections()
+        if settings.REPLICA_DATABASES and self.is_write(request, response):
+            pin_user(request.user.pk)
+        return response
+
+    @staticmethod
+    def is_write(request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400:
+            return False
+        user = getattr(request, "user", None)
+        return user is not None and user.is_authenticated
@@ -28,6 +28,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.MetricsMiddleware",
+    "foodgram.replicas.ReplicaMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -66,9 +68,61 @@ DATABASES = {
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD"),
         "HOST": os.environ.get("DB_HOST"),
         "PORT": os.environ.get("DB_PORT"),
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", default=60)),
     }
 }
 
+CONN_HEALTH_CHECKS = os.getenv("DB_CONN_HEALTH_CHECKS", default="1") == "1"
+CONN_HEALTH_CHECK_INTERVAL = 10
+
+# Реплики задаются через запятую: хосты PostgreSQL или, для локальной
+# проверки, файлы SQLite с копией основной базы.
+REPLICA_DATABASES = []
+REPLICA_SETTING = (
+    "NAME" if "sqlite" in (DATABASES["default"]["ENGINE"] or "") else "HOST"
+)
+for number, replica in enumerate(
+    filter(None, os.getenv("DB_REPLICAS", default="").split(",")), 1
+):
+    DATABASES[f"replica_{number}"] = dict(
+        DATABASES["default"],
+        **{REPLICA_SETTING: replica.strip()},
+        TEST={"MIRROR": "default"},
+    )
+    REPLICA_DATABASES.append(f"replica_{number}")
+
+DATABASE_ROUTERS = ["foodgram.replicas.ReplicaRouter"]
+REPLICA_PIN_TIMEOUT = 5
+
+if "postgresql" in (DATABASES["default"]["ENGINE"] or ""):
+    INSTALLED_APPS.append("django.contrib.postgres")
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", default=""),
+    }
+}
+
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24
+
+RECIPE_FEED_CACHE_TIMEOUT = 60 * 10
+
+RECIPE_FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+INGREDIENT_SEARCH_LIMIT = 20
+
+IMAGE_PROCESSING_WORKERS = int(os.getenv("IMAGE_PROCESSING_WORKERS", default=2))
+
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TIMEOUT = 60
+AUTH_TOKEN_SHARED_CACHE = os.getenv("AUTH_TOKEN_SHARED_CACHE", default="") == "1"
+
+REQUEST_QUERY_BUDGET = int(os.getenv("REQUEST_QUERY_BUDGET", default=50))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -97,6 +151,9 @@ USE_TZ = True
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+RESIZED_IMAGE_SIZES = ((240, 240), (480, 480), (960, 960))
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv("MEDIA_ACCEL_REDIRECT_PREFIX", default="")
+
 STATIC_URL = "/staticfiles/"
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 
@@ -109,7 +166,7 @@ REST_FRAMEWORK = {
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
     ],
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "api.authentication.CachedTokenAuthentication",
     ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 6,
@@ -1,11 +1,19 @@
+from api.views import metrics
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
+from recipes.views import resized_image
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("api.urls")),
+    path("metrics", metrics, name="metrics"),
+    path(
+        "media/resized/<int:width>x<int:height>/<path:path>",
+        resized_image,
+        name="resized_image",
+    ),
 ]
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
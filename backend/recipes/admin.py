@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 from .models import (AmountIngredientRecipe, Cart, Favorites, Ingredient,
-                     Recipe, Tag)
+                     Recipe, RecipeImageVariant, ShoppingListItem, Tag)
 
 
 class AmountIngredientInRecipeAdmin(admin.TabularInline):
@@ -9,6 +9,11 @@ class AmountIngredientInRecipeAdmin(admin.TabularInline):
     min_num = 1
 
 
+class RecipeImageVariantInline(admin.TabularInline):
+    model = RecipeImageVariant
+    extra = 0
+
+
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     pass
@@ -23,12 +28,24 @@ class RecipeAdmin(admin.ModelAdmin):
     )
     search_fields = ("author", "name", "tags")
     list_filter = ("author", "name", "tags")
-    inlines = [AmountIngredientInRecipeAdmin]
+    inlines = [AmountIngredientInRecipeAdmin, RecipeImageVariantInline]
 
     @staticmethod
     def count_favorites(obj):
         return obj.favorites.count()
 
+    def save_related(self, request, form, formsets, change):
+        """Переносит изменения состава из инлайна в списки покупок"""
+        old_amounts = ShoppingListItem.objects.get_recipe_amounts(
+            form.instance.pk
+        )
+        super().save_related(request, form, formsets, change)
+        ShoppingListItem.objects.change_recipe(
+            form.instance.pk,
+            old_amounts,
+            ShoppingListItem.objects.get_recipe_amounts(form.instance.pk),
+        )
+
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
@@ -49,4 +66,20 @@ class CartAdmin(admin.ModelAdmin):
 
 @admin.register(AmountIngredientRecipe)
 class AmountIngredientRecipeAdmin(admin.ModelAdmin):
-    pass
+    """Только просмотр: состав меняется в рецепте, чтобы изменения
+    попадали в списки покупок"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ("user", "ingredient", "amount")
+    list_filter = ("user",)
@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from api.recipe_feed import invalidate_feed
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Recipe, RecipeImageVariant
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    RecipeImageVariant.LARGE: ("JPEG", "jpg", 1280),
+    RecipeImageVariant.THUMBNAIL: ("JPEG", "jpg", 480),
+    RecipeImageVariant.WEBP: ("WEBP", "webp", 1280),
+    RecipeImageVariant.THUMBNAIL_WEBP: ("WEBP", "webp", 480),
+}
+
+MAX_IMAGE_SIZE = 2560
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_PROCESSING_WORKERS,
+    thread_name_prefix="recipe-images",
+)
+
+
+def render_variants(image_file):
+    """Перекодирует изображение без метаданных в размеры из VARIANTS"""
+    with Image.open(image_file) as image:
+        source = ImageOps.exif_transpose(image).convert("RGB")
+    for kind, (image_format, extension, size) in VARIANTS.items():
+        variant = source.copy()
+        variant.thumbnail((size, size), Image.LANCZOS)
+        buffer = BytesIO()
+        variant.save(buffer, image_format, quality=85, optimize=True)
+        yield kind, extension, buffer.getvalue()
+
+
+def is_normalized(image, max_size=MAX_IMAGE_SIZE):
+    """JPEG в пределах max_size без сегментов метаданных: такой
+    файл normalize_image только ухудшил бы повторным сжатием"""
+    if image.format != "JPEG" or max(image.size) > max_size:
+        return False
+    return all(marker == "APP0" for marker, _ in image.applist)
+
+
+def normalize_image(content, max_size=MAX_IMAGE_SIZE):
+    """Перекодирует загруженное изображение в JPEG без метаданных.
+
+    Не использует Django, поэтому подходит для запуска в пуле процессов.
+    Возвращает байты изображения или None, если файл не читается."""
+    try:
+        with Image.open(BytesIO(content)) as image:
+            normalized = ImageOps.exif_transpose(image).convert("RGB")
+    except (OSError, ValueError):
+        return None
+    normalized.thumbnail((max_size, max_size), Image.LANCZOS)
+    buffer = BytesIO()
+    normalized.save(buffer, "JPEG", quality=85, optimize=True)
+    return buffer.getvalue()
+
+
+def resize_image(source_path, target_path, size):
+    """Сохраняет уменьшенную до size копию изображения без метаданных.
+
+    Файл сначала пишется рядом под временным именем, чтобы параллельные
+    запросы не получили недописанное изображение."""
+    with Image.open(source_path) as image:
+        image_format = image.format
+        resized = ImageOps.exif_transpose(image)
+        if image_format == "JPEG":
+            resized = resized.convert("RGB")
+        resized.thumbnail(size, Image.LANCZOS)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    temporary_path = f"{target_path}.{os.getpid()}.{threading.get_ident()}"
+    try:
+        resized.save(temporary_path, image_format, quality=85, optimize=True)
+        os.replace(temporary_path, target_path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def process_recipe_image(recipe_id):
+    """Перекодирует изображение рецепта без метаданных, создает его
+    варианты и заменяет ими старые"""
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None:
+        return
+    source_name = recipe.image.name
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    with recipe.image.open("rb") as image_file:
+        content = image_file.read()
+    with Image.open(BytesIO(content)) as image:
+        normalized = None if is_normalized(image) else normalize_image(content)
+    image_name = source_name
+    if normalized is not None:
+        # Исходный файл со всеми метаданными больше не отдается,
+        # его удалит collect_media_garbage
+        image_name = recipe.image.storage.save(
+            recipe.image.field.generate_filename(recipe, f"{stem}.jpg"),
+            ContentFile(normalized),
+        )
+    variants = []
+    for kind, extension, variant_content in render_variants(BytesIO(content)):
+        variant = RecipeImageVariant(recipe=recipe, kind=kind)
+        variant.image.save(
+            f"{stem}_{kind}.{extension}",
+            ContentFile(variant_content),
+            save=False,
+        )
+        variants.append(variant)
+    with transaction.atomic():
+        current = Recipe.objects.select_for_update().filter(pk=recipe_id)
+        if current.values_list("image", flat=True).first() != source_name:
+            stale = variants
+        else:
+            stale = list(recipe.image_variants.all())
+            recipe.image_variants.all().delete()
+            RecipeImageVariant.objects.bulk_create(variants)
+            current.update(image=image_name, updated_at=timezone.now())
+            # bulk_create и update не отправляют сигналы
+            invalidate_feed()
+    for variant in stale:
+        variant.image.delete(save=False)
+
+
+def run_image_processing(recipe_id):
+    close_old_connections()
+    try:
+        process_recipe_image(recipe_id)
+    except Exception:
+        logger.exception(
+            "Не удалось обработать изображение рецепта %s", recipe_id
+        )
+    finally:
+        close_old_connections()
+
+
+def schedule_image_processing(recipe):
+    """Передает обработку изображения в фоновый поток
+    после фиксации транзакции"""
+    transaction.on_commit(
+        lambda: executor.submit(run_image_processing, recipe.id)
+    )
@@ -0,0 +1,183 @@
+import csv
+import io
+import json
+import os
+from itertools import islice
+
+from api.cache_versions import bump_version
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+DATA_ROOT = os.path.join(settings.BASE_DIR, "data")
+READ_SIZE = 64 * 1024
+
+
+def read_csv(file, fields):
+    for line_number, row in enumerate(csv.reader(file), 1):
+        if len(row) != len(fields):
+            raise CommandError(
+                f"Строка {line_number}: ожидается полей {len(fields)}"
+            )
+        yield tuple(row)
+
+
+def read_json(file, fields):
+    """Читает JSON-массив объектов по одному, не загружая файл целиком"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+            position += 1
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                if buffer[position:].strip():
+                    raise CommandError("Некорректный JSON")
+                return
+            chunk = file.read(READ_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        try:
+            yield tuple(item[field] for field in fields)
+        except (KeyError, TypeError):
+            raise CommandError(f"Объект без полей {', '.join(fields)}")
+
+
+READERS = {"csv": read_csv, "json": read_json}
+
+
+class IterableFile(io.RawIOBase):
+    """Файловый интерфейс для генератора строк, нужен для COPY"""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self.buffer:
+            try:
+                self.buffer = next(self.lines).encode("utf-8")
+            except StopIteration:
+                return 0
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+
+class BulkLoadCommand(BaseCommand):
+    """Потоковая загрузка справочника пакетами bulk_create.
+
+    Повторный запуск не создает дубликатов: конфликты с уникальными
+    ограничениями модели пропускаются."""
+
+    model = None
+    fields = ()
+    default_filename = None
+    cache_version = None
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "filename",
+            default=self.default_filename,
+            nargs="?",
+            type=str
+        )
+        parser.add_argument(
+            "--format",
+            choices=sorted(READERS),
+            help="Формат файла, по умолчанию определяется по расширению",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--copy",
+            action="store_true",
+            help="Загрузить через COPY (только PostgreSQL)",
+        )
+
+    def read_rows(self, file, file_format):
+        return READERS[file_format](file, self.fields)
+
+    def insert_batches(self, rows, batch_size):
+        total = 0
+        while True:
+            batch = [
+                self.model(**dict(zip(self.fields, row)))
+                for row in islice(rows, batch_size)
+            ]
+            if not batch:
+                return total
+            self.model.objects.bulk_create(batch, ignore_conflicts=True)
+            total += len(batch)
+
+    def copy_rows(self, rows):
+        """COPY во временную таблицу и перенос без конфликтующих строк"""
+        table = self.model._meta.db_table
+        columns = ", ".join(self.fields)
+        counter = {"total": 0}
+
+        def lines():
+            output = io.StringIO()
+            writer = csv.writer(output)
+            for row in rows:
+                counter["total"] += 1
+                writer.writerow(row)
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+
+        with connection.cursor() as cursor:
+            # Только загружаемые столбцы: LIKE скопировал бы NOT NULL
+            # первичного ключа без его значения по умолчанию
+            cursor.execute(
+                "CREATE TEMPORARY TABLE bulk_load ON COMMIT DROP AS "
+                f"SELECT {columns} FROM {table} WITH NO DATA"
+            )
+            cursor.copy_expert(
+                f"COPY bulk_load ({columns}) FROM STDIN WITH CSV",
+                IterableFile(lines()),
+            )
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) "
+                f"SELECT DISTINCT {columns} FROM bulk_load "
+                "ON CONFLICT DO NOTHING"
+            )
+        return counter["total"]
+
+    def handle(self, *args, **options):
+        path = os.path.join(DATA_ROOT, options["filename"])
+        file_format = options["format"] or os.path.splitext(path)[1][1:]
+        if file_format not in READERS:
+            raise CommandError(f"Неизвестный формат файла: {file_format}")
+        if options["copy"] and connection.vendor != "postgresql":
+            raise CommandError("--copy доступен только для PostgreSQL")
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                rows = self.read_rows(file, file_format)
+                with transaction.atomic():
+                    before = self.model.objects.count()
+                    if options["copy"]:
+                        total = self.copy_rows(rows)
+                    else:
+                        total = self.insert_batches(
+                            rows, options["batch_size"]
+                        )
+                    inserted = self.model.objects.count() - before
+        except FileNotFoundError:
+            raise CommandError(
+                f"Файл {options['filename']} отсутствует в директории data"
+            )
+        if inserted:
+            bump_version(self.cache_version)
+        self.stdout.write(
+            f"Добавлено: {inserted}, пропущено: {total - inserted}"
+        )
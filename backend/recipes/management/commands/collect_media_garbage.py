@@ -0,0 +1,72 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe, RecipeImageVariant
+
+MEDIA_DIRS = ("photo",)
+RESIZED_DIR = "resized"
+
+
+class Command(BaseCommand):
+    help = "Удаляет из MEDIA_ROOT изображения, на которые нет ссылок"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать файлы, которые будут удалены",
+        )
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=60 * 60,
+            help="Не трогать файлы моложе указанного числа секунд",
+        )
+
+    @staticmethod
+    def walk(directory):
+        root = os.path.join(settings.MEDIA_ROOT, directory)
+        for path, _, filenames in os.walk(root):
+            for filename in filenames:
+                full_path = os.path.join(path, filename)
+                yield os.path.relpath(
+                    full_path, settings.MEDIA_ROOT
+                ).replace(os.sep, "/")
+
+    def handle(self, *args, **options):
+        referenced = set(Recipe.objects.values_list("image", flat=True))
+        referenced.update(
+            RecipeImageVariant.objects.values_list("image", flat=True)
+        )
+        threshold = time.time() - options["min_age"]
+        garbage = []
+        for directory in MEDIA_DIRS:
+            garbage.extend(
+                name for name in self.walk(directory)
+                if name not in referenced
+            )
+        prefix_length = len(RESIZED_DIR) + 1
+        for name in self.walk(RESIZED_DIR):
+            source = name[prefix_length:].split("/", 1)[-1]
+            if source not in referenced:
+                garbage.append(name)
+
+        removed = 0
+        freed = 0
+        for name in garbage:
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            stat = os.stat(path)
+            if stat.st_mtime > threshold:
+                continue
+            if options["dry_run"]:
+                self.stdout.write(name)
+            else:
+                os.remove(path)
+            removed += 1
+            freed += stat.st_size
+        action = "Будет удалено" if options["dry_run"] else "Удалено"
+        self.stdout.write(
+            f"{action} файлов: {removed}, освобождено байт: {freed}"
+        )
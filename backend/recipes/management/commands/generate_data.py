@@ -0,0 +1,230 @@
+import random
+import time
+from io import BytesIO
+
+from api.cache_versions import bump_version
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from PIL import Image
+from recipes.models import (AmountIngredientRecipe, Cart, Favorites,
+                            Ingredient, Recipe, Tag)
+from users.models import Follow
+
+User = get_user_model()
+
+PASSWORD = "synthetic-password"
+PLACEHOLDER_COLORS = ("#E26C2D", "#49B64E", "#8775D2", "#F5C542", "#2D9CDB")
+WORDS = (
+    "Суп", "Салат", "Пирог", "Рагу", "Паста", "Каша", "Запеканка",
+    "домашний", "быстрый", "острый", "летний", "сытный", "постный",
+)
+
+
+def power_law(rng, alpha, maximum):
+    """Случайное число от 1 до maximum с распределением Парето"""
+    return min(maximum, int(rng.paretovariate(alpha)))
+
+
+def skewed_index(rng, size, exponent):
+    """Индекс от 0 до size, где малые значения встречаются чаще.
+
+    Так выбираются популярные авторы, рецепты и ингредиенты без
+    хранения весов для каждого объекта."""
+    return int(size * rng.random() ** exponent)
+
+
+class Command(BaseCommand):
+    help = (
+        "Создает синтетических пользователей, рецепты, избранное, "
+        "корзины и подписки для нагрузочного тестирования. При одинаковом "
+        "--seed данные совпадают."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--recipes", type=int, default=10000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--max-ingredients",
+            type=int,
+            default=20,
+            help="Наибольшее число ингредиентов в рецепте",
+        )
+        parser.add_argument(
+            "--max-favorites",
+            type=int,
+            default=200,
+            help="Наибольшее число рецептов в избранном у пользователя",
+        )
+        parser.add_argument(
+            "--max-cart",
+            type=int,
+            default=30,
+            help="Наибольшее число рецептов в корзине у пользователя",
+        )
+        parser.add_argument(
+            "--max-follows",
+            type=int,
+            default=100,
+            help="Наибольшее число подписок у пользователя",
+        )
+
+    @staticmethod
+    def next_id(model):
+        return (model.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+
+    def get_images(self):
+        """Имена файлов из media/photo или новые заглушки"""
+        storage = Recipe._meta.get_field("image").storage
+        try:
+            files = storage.listdir("photo")[1]
+        except FileNotFoundError:
+            files = []
+        images = sorted(f"photo/{name}" for name in files)
+        if images:
+            return images
+        for color in PLACEHOLDER_COLORS:
+            buffer = BytesIO()
+            Image.new("RGB", (640, 480), color).save(buffer, "JPEG")
+            images.append(
+                storage.save("photo/image.jpg", ContentFile(buffer.getvalue()))
+            )
+        return images
+
+    def log(self, message, started):
+        self.stdout.write(f"{message} ({time.monotonic() - started:.1f} с)")
+
+    def create_users(self, rng, count):
+        first_id = self.next_id(User)
+        password = make_password(PASSWORD)
+        User.objects.bulk_create([
+            User(
+                id=user_id,
+                username=f"synthetic_{user_id}",
+                email=f"synthetic_{user_id}@example.com",
+                first_name=rng.choice(("Анна", "Иван", "Мария", "Петр")),
+                last_name=f"Тестовый {user_id}",
+                password=password,
+            )
+            for user_id in range(first_id, first_id + count)
+        ])
+        return first_id
+
+    def create_recipes(self, rng, options, first_user_id, images):
+        """Рецепты вместе с тегами и ингредиентами пакетами"""
+        users = options["users"]
+        first_id = self.next_id(Recipe)
+        tag_ids = list(Tag.objects.order_by("id").values_list("id", flat=True))
+        ingredient_ids = list(
+            Ingredient.objects.order_by("id").values_list("id", flat=True)
+        )
+        if not tag_ids or not ingredient_ids:
+            raise CommandError(
+                "Сначала загрузите теги и ингредиенты: "
+                "load_tags, load_ingredients"
+            )
+        through = Recipe.tags.through
+        last_id = first_id + options["recipes"]
+        for start in range(first_id, last_id, options["batch_size"]):
+            recipes, tags, amounts = [], [], []
+            for recipe_id in range(
+                start, min(start + options["batch_size"], last_id)
+            ):
+                recipes.append(Recipe(
+                    id=recipe_id,
+                    author_id=first_user_id + skewed_index(rng, users, 3),
+                    name=f"{rng.choice(WORDS[:7])} {rng.choice(WORDS[7:])}",
+                    text="Синтетический рецепт для нагрузочного теста.",
+                    image=rng.choice(images),
+                    cooking_time=rng.randint(1, 180),
+                ))
+                for tag_id in rng.sample(
+                    tag_ids, power_law(rng, 2, len(tag_ids))
+                ):
+                    tags.append(through(recipe_id=recipe_id, tag_id=tag_id))
+                count = power_law(rng, 1.2, options["max_ingredients"])
+                chosen = {
+                    ingredient_ids[
+                        skewed_index(rng, len(ingredient_ids), 2)
+                    ]
+                    for _ in range(count)
+                }
+                amounts.extend(
+                    AmountIngredientRecipe(
+                        recipe_id=recipe_id,
+                        ingredient_id=ingredient_id,
+                        amount=rng.randint(1, 500),
+                    )
+                    for ingredient_id in sorted(chosen)
+                )
+            with transaction.atomic():
+                Recipe.objects.bulk_create(recipes)
+                through.objects.bulk_create(tags)
+                AmountIngredientRecipe.objects.bulk_create(amounts)
+        return first_id
+
+    def create_edges(self, rng, model, field, targets, maximum, options):
+        """Связи пользователей с популярными рецептами или авторами"""
+        first_user_id, users = self.first_user_id, options["users"]
+        first_target_id, size = targets
+        batch = []
+        for user_id in range(first_user_id, first_user_id + users):
+            chosen = {
+                first_target_id + skewed_index(rng, size, 3)
+                for _ in range(power_law(rng, 1.1, maximum))
+            }
+            batch.extend(
+                model(user_id=user_id, **{field: target_id})
+                for target_id in sorted(chosen)
+                if not (field == "author_id" and target_id == user_id)
+            )
+            if len(batch) >= options["batch_size"]:
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def handle(self, *args, **options):
+        if options["users"] < 1 or options["recipes"] < 1:
+            raise CommandError("--users и --recipes должны быть больше 0")
+        rng = random.Random(options["seed"])
+        started = time.monotonic()
+        images = self.get_images()
+
+        self.first_user_id = self.create_users(rng, options["users"])
+        self.log(f"Пользователей: {options['users']}", started)
+        first_recipe_id = self.create_recipes(
+            rng, options, self.first_user_id, images
+        )
+        self.log(f"Рецептов: {options['recipes']}", started)
+
+        recipes = (first_recipe_id, options["recipes"])
+        with transaction.atomic():
+            self.create_edges(
+                rng, Favorites, "recipe_id", recipes,
+                options["max_favorites"], options,
+            )
+            self.create_edges(
+                rng, Cart, "recipe_id", recipes, options["max_cart"], options
+            )
+            self.create_edges(
+                rng, Follow, "author_id",
+                (self.first_user_id, options["users"]),
+                options["max_follows"], options,
+            )
+        self.log("Избранное, корзины и подписки созданы", started)
+
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(), [User, Recipe]
+            ):
+                cursor.execute(sql)
+        call_command("rebuild_shopping_lists", stdout=self.stdout)
+        bump_version("recipes")
+        self.log(f"Готово. Пароль пользователей: {PASSWORD}", started)
@@ -0,0 +1,259 @@
+import json
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from api.cache_versions import bump_version
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.images import normalize_image
+from recipes.models import AmountIngredientRecipe, Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+MANIFEST = "recipes.jsonl"
+
+
+class RecordError(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует рецепты из JSONL-файла или zip-архива с файлом "
+        f"{MANIFEST} и изображениями. Каждая строка - объект с полями "
+        "name, text, cooking_time, image (путь к файлу), tags (slug), "
+        "ingredients (name, measurement_unit, amount) и необязательным "
+        "author (email). После сбоя повторный запуск продолжает работу "
+        "с первой незафиксированной партии."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=str)
+        parser.add_argument(
+            "--author",
+            help="Email автора для записей без поля author",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Число процессов для обработки изображений",
+        )
+        parser.add_argument(
+            "--create-missing",
+            action="store_true",
+            help="Создавать отсутствующие ингредиенты",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Начать заново, игнорируя сохраненный прогресс",
+        )
+
+    def open_source(self, path):
+        """Возвращает строки манифеста и функцию чтения изображений"""
+        if zipfile.is_zipfile(path):
+            archive = zipfile.ZipFile(path)
+            lines = archive.open(MANIFEST)
+            return (
+                (line.decode("utf-8") for line in lines),
+                archive.read,
+            )
+        base_dir = os.path.dirname(os.path.abspath(path))
+
+        def read_image(name):
+            with open(os.path.join(base_dir, name), "rb") as file:
+                return file.read()
+
+        return open(path, encoding="utf-8"), read_image
+
+    @staticmethod
+    def read_checkpoint(checkpoint):
+        if not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint) as file:
+            return int(file.read() or 0)
+
+    @staticmethod
+    def write_checkpoint(checkpoint, line_number):
+        temporary = f"{checkpoint}.tmp"
+        with open(temporary, "w") as file:
+            file.write(str(line_number))
+        os.replace(temporary, checkpoint)
+
+    def get_author_id(self, email):
+        if email not in self.authors:
+            self.authors[email] = (
+                User.objects.filter(email=email)
+                .values_list("id", flat=True)
+                .first()
+            )
+        if self.authors[email] is None:
+            raise RecordError(f"автор {email} не найден")
+        return self.authors[email]
+
+    def get_ingredient_id(self, name, measurement_unit):
+        key = (name, measurement_unit)
+        if key not in self.ingredients:
+            if not self.create_missing:
+                raise RecordError(f"ингредиент {name} не найден")
+            self.ingredients[key] = Ingredient.objects.create(
+                name=name, measurement_unit=measurement_unit
+            ).id
+            self.ingredients_created = True
+        return self.ingredients[key]
+
+    def parse_record(self, line):
+        """Проверяет запись и заменяет названия на id"""
+        try:
+            data = json.loads(line)
+            cooking_time = int(data["cooking_time"])
+            if cooking_time < 1:
+                raise RecordError("cooking_time меньше 1")
+            amounts = {}
+            for item in data["ingredients"]:
+                amount = int(item["amount"])
+                if amount < 1:
+                    raise RecordError("количество ингредиента меньше 1")
+                ingredient_id = self.get_ingredient_id(
+                    item["name"], item["measurement_unit"]
+                )
+                amounts[ingredient_id] = amounts.get(ingredient_id, 0) + amount
+            tag_ids = []
+            for slug in data.get("tags", []):
+                if slug not in self.tags:
+                    raise RecordError(f"тег {slug} не найден")
+                tag_ids.append(self.tags[slug])
+            author = data.get("author") or self.default_author
+            return {
+                "recipe": Recipe(
+                    author_id=self.get_author_id(author),
+                    name=data["name"][:200],
+                    text=data["text"],
+                    cooking_time=cooking_time,
+                ),
+                "image": data["image"],
+                "tags": tag_ids,
+                "amounts": amounts,
+            }
+        except (KeyError, TypeError, ValueError) as error:
+            raise RecordError(f"некорректная запись: {error!r}")
+
+    def prepare_batch(self, lines, read_image, executor):
+        records = []
+        for line_number, line in lines:
+            try:
+                record = self.parse_record(line)
+                record["content"] = read_image(record["image"])
+            except (RecordError, KeyError, OSError) as error:
+                self.stderr.write(f"Строка {line_number}: {error}")
+                self.skipped += 1
+                continue
+            records.append(record)
+        images = executor.map(
+            normalize_image,
+            [record.pop("content") for record in records],
+            chunksize=8,
+        )
+        prepared = []
+        for record, content in zip(records, images):
+            if content is None:
+                self.stderr.write(f"Не читается изображение {record['image']}")
+                self.skipped += 1
+                continue
+            name = Recipe._meta.get_field("image").storage.save(
+                "photo/image.jpg", ContentFile(content)
+            )
+            record["recipe"].image = name
+            prepared.append(record)
+        return prepared
+
+    @staticmethod
+    def save_batch(records):
+        recipes = [record["recipe"] for record in records]
+        if connection.features.can_return_ids_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+        else:
+            for recipe in recipes:
+                recipe.save()
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=record["recipe"].id, tag_id=tag_id)
+            for record in records
+            for tag_id in set(record["tags"])
+        ])
+        AmountIngredientRecipe.objects.bulk_create([
+            AmountIngredientRecipe(
+                recipe_id=record["recipe"].id,
+                ingredient_id=ingredient_id,
+                amount=amount,
+            )
+            for record in records
+            for ingredient_id, amount in record["amounts"].items()
+        ])
+
+    def report(self, started, final=False):
+        elapsed = time.monotonic() - started
+        rate = self.imported / elapsed if elapsed else 0
+        prefix = "Итого" if final else "Прогресс"
+        self.stdout.write(
+            f"{prefix}: импортировано {self.imported}, "
+            f"пропущено {self.skipped}, {elapsed:.1f} с, "
+            f"{rate:.0f} рецептов/с"
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not os.path.exists(path):
+            raise CommandError(f"Файл {path} не найден")
+        checkpoint = f"{path}.checkpoint"
+        if options["restart"] and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        done = self.read_checkpoint(checkpoint)
+
+        self.default_author = options["author"]
+        self.create_missing = options["create_missing"]
+        self.ingredients_created = False
+        self.authors = {}
+        self.ingredients = {
+            (name, measurement_unit): pk
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                "id", "name", "measurement_unit"
+            )
+        }
+        self.tags = dict(Tag.objects.values_list("slug", "id"))
+        self.imported = self.skipped = 0
+
+        manifest, read_image = self.open_source(path)
+        lines = (
+            (line_number, line)
+            for line_number, line in enumerate(manifest, 1)
+            if line_number > done and line.strip()
+        )
+        started = time.monotonic()
+        with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            while True:
+                batch = list(islice(lines, options["batch_size"]))
+                if not batch:
+                    break
+                records = self.prepare_batch(batch, read_image, executor)
+                with transaction.atomic():
+                    self.save_batch(records)
+                self.write_checkpoint(checkpoint, batch[-1][0])
+                self.imported += len(records)
+                self.report(started)
+        if self.ingredients_created:
+            bump_version("ingredients")
+        if self.imported:
+            bump_version("recipes")
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.report(started, final=True)
+        self.stdout.write(
+            "Варианты изображений создаст команда process_recipe_images"
+        )
@@ -1,36 +1,11 @@
-import csv
-import os
-
-from django.conf import settings
-from django.core.management.base import BaseCommand, CommandError
+from recipes.management.bulk_load import BulkLoadCommand
 from recipes.models import Ingredient
 
-DATA_ROOT = os.path.join(settings.BASE_DIR, "data")
-
 
-class Command(BaseCommand):
-    def add_arguments(self, parser):
-        parser.add_argument(
-            "filename",
-            default="ingredients.csv",
-            nargs="?",
-            type=str
-        )
+class Command(BulkLoadCommand):
+    help = "Загружает ингредиенты из data/ingredients.csv или .json"
 
-    def handle(self, *args, **options):
-        try:
-            with open(
-                os.path.join(DATA_ROOT, options["filename"]),
-                    "r",
-                    encoding="utf-8"
-            ) as f:
-                data = csv.reader(f)
-                for row in data:
-                    name, measurement_unit = row
-                    Ingredient.objects.get_or_create(
-                        name=name, measurement_unit=measurement_unit
-                    )
-        except FileNotFoundError:
-            raise CommandError(
-                "Файл ingredients отсутствует в директории " "data"
-            )
+    model = Ingredient
+    fields = ("name", "measurement_unit")
+    default_filename = "ingredients.csv"
+    cache_version = "ingredients"
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from recipes.images import VARIANTS, process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Создает варианты изображений для рецептов, у которых их нет"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Пересоздать варианты для всех рецептов",
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if not options["all"]:
+            recipes = recipes.annotate(
+                variants_count=Count("image_variants")
+            ).filter(variants_count__lt=len(VARIANTS))
+        processed = 0
+        for recipe_id in recipes.values_list("id", flat=True).iterator():
+            process_recipe_image(recipe_id)
+            processed += 1
+        self.stdout.write(f"Обработано рецептов: {processed}")
@@ -0,0 +1,75 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+from recipes.models import AmountIngredientRecipe, ShoppingListItem
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает и проверяет таблицу списков покупок"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Только сравнить таблицу с корзинами, не изменяя ее",
+        )
+
+    @staticmethod
+    def get_expected():
+        totals = (
+            AmountIngredientRecipe.objects.filter(recipe__cart__isnull=False)
+            .values("recipe__cart__user_id", "ingredient_id")
+            .annotate(total=Sum("amount"))
+            .order_by()
+        )
+        return {
+            (item["recipe__cart__user_id"], item["ingredient_id"]):
+                item["total"]
+            for item in totals.iterator()
+        }
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = self.get_expected()
+            actual = {
+                (user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount
+                in ShoppingListItem.objects.values_list(
+                    "user_id", "ingredient_id", "amount"
+                ).iterator()
+            }
+            mismatches = {
+                key
+                for key in set(expected) | set(actual)
+                if expected.get(key) != actual.get(key)
+            }
+            if options["verify"]:
+                if mismatches:
+                    raise CommandError(
+                        f"Расхождений в списках покупок: {len(mismatches)}"
+                    )
+                self.stdout.write("Списки покупок совпадают с корзинами")
+                return
+            ShoppingListItem.objects.all().delete()
+            items = iter(expected.items())
+            while True:
+                batch = [
+                    ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount,
+                    )
+                    for (user_id, ingredient_id), amount
+                    in islice(items, BATCH_SIZE)
+                ]
+                if not batch:
+                    break
+                ShoppingListItem.objects.bulk_create(batch)
+        self.stdout.write(
+            f"Записей в списках покупок: {len(expected)}, "
+            f"исправлено расхождений: {len(mismatches)}"
+        )
@@ -0,0 +1,66 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0003_ingredient_name_trigram_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecipeImageVariant",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("large", "Большое"),
+                            ("thumbnail", "Миниатюра"),
+                            ("webp", "Большое WebP"),
+                            ("thumbnail_webp", "Миниатюра WebP"),
+                        ],
+                        max_length=20,
+                        verbose_name="Вариант",
+                    ),
+                ),
+                (
+                    "image",
+                    models.ImageField(
+                        upload_to="photo/variants/", verbose_name="Изображение"
+                    ),
+                ),
+                (
+                    "recipe",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="image_variants",
+                        to="recipes.Recipe",
+                        verbose_name="Рецепт",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Вариант изображения",
+                "verbose_name_plural": "Варианты изображений",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="recipeimagevariant",
+            constraint=models.UniqueConstraint(
+                fields=("recipe", "kind"), name="unique_recipe_image_variant"
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:35
+
+import recipes.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0004_recipeimagevariant"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="recipe",
+            name="image",
+            field=models.ImageField(
+                default=None,
+                storage=recipes.storage.ContentAddressedStorage(),
+                upload_to="photo/",
+                verbose_name="Изображение",
+            ),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
@@ -12,6 +14,12 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = "Ингредиент"
         verbose_name_plural = "Ингредиенты"
+        constraints = [
+            models.UniqueConstraint(
+                fields=("name", "measurement_unit"),
+                name="unique_ingredient_name_measurement_unit",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.measurement_unit}."
@@ -35,6 +43,7 @@ class Recipe(models.Model):
         "Дата публикации",
         auto_now_add=True
     )
+    updated_at = models.DateTimeField("Дата изменения", auto_now=True)
 
     author = models.ForeignKey(
         User,
@@ -44,7 +53,11 @@ class Recipe(models.Model):
     )
     name = models.CharField("Название", max_length=200)
     image = models.ImageField(
-        "Изображение", upload_to="photo/", null=False, default=None
+        "Изображение",
+        upload_to="photo/",
+        storage=ContentAddressedStorage(),
+        null=False,
+        default=None,
     )
     text = models.TextField("Описание")
 
@@ -79,6 +92,42 @@ class Recipe(models.Model):
         return self.name
 
 
+class RecipeImageVariant(models.Model):
+    """Уменьшенная или перекодированная копия изображения рецепта"""
+
+    LARGE = "large"
+    THUMBNAIL = "thumbnail"
+    WEBP = "webp"
+    THUMBNAIL_WEBP = "thumbnail_webp"
+    KINDS = (
+        (LARGE, "Большое"),
+        (THUMBNAIL, "Миниатюра"),
+        (WEBP, "Большое WebP"),
+        (THUMBNAIL_WEBP, "Миниатюра WebP"),
+    )
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="image_variants",
+        verbose_name="Рецепт",
+    )
+    kind = models.CharField("Вариант", max_length=20, choices=KINDS)
+    image = models.ImageField("Изображение", upload_to="photo/variants/")
+
+    class Meta:
+        verbose_name = "Вариант изображения"
+        verbose_name_plural = "Варианты изображений"
+        constraints = [
+            models.UniqueConstraint(
+                fields=("recipe", "kind"), name="unique_recipe_image_variant"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} для рецепта {self.recipe}."
+
+
 class AmountIngredientRecipe(models.Model):
     recipe = models.ForeignKey(
         Recipe,
@@ -170,3 +219,119 @@ class Cart(models.Model):
 
     def __str__(self):
         return f"Рецепт {self.recipe} в корзине у пользователя {self.user}."
+
+
+class ShoppingListItemManager(models.Manager):
+    def apply(self, user_ids, deltas):
+        """Изменяет количества ингредиентов в списках покупок
+        пользователей на величины из deltas"""
+        user_ids = list(user_ids)
+        deltas = {
+            ingredient_id: delta
+            for ingredient_id, delta in deltas.items()
+            if delta
+        }
+        if not user_ids or not deltas:
+            return
+        with transaction.atomic():
+            existing = self.lock_items(user_ids, deltas)
+            missing = [
+                self.model(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=0
+                )
+                for user_id in user_ids
+                for ingredient_id, delta in deltas.items()
+                if delta > 0 and (user_id, ingredient_id) not in existing
+            ]
+            if missing:
+                # Строку мог вставить параллельный apply: пустые строки
+                # создаются без конфликта и блокируются вместе с ней
+                self.bulk_create(missing, ignore_conflicts=True)
+                existing = self.lock_items(user_ids, deltas)
+            to_update, to_delete = [], []
+            for item in existing.values():
+                item.amount += deltas[item.ingredient_id]
+                if item.amount > 0:
+                    to_update.append(item)
+                else:
+                    to_delete.append(item.pk)
+            self.bulk_update(to_update, ["amount"])
+            self.filter(pk__in=to_delete).delete()
+
+    def lock_items(self, user_ids, deltas):
+        return {
+            (item.user_id, item.ingredient_id): item
+            for item in self.select_for_update().filter(
+                user_id__in=user_ids, ingredient_id__in=deltas
+            )
+        }
+
+    @staticmethod
+    def get_recipe_amounts(recipe_id):
+        return dict(
+            AmountIngredientRecipe.objects.filter(
+                recipe_id=recipe_id
+            ).values_list("ingredient_id", "amount")
+        )
+
+    def add_recipe(self, user_id, recipe_id):
+        self.apply([user_id], self.get_recipe_amounts(recipe_id))
+
+    def remove_recipe(self, user_id, recipe_id):
+        self.apply([user_id], {
+            ingredient_id: -amount
+            for ingredient_id, amount
+            in self.get_recipe_amounts(recipe_id).items()
+        })
+
+    def change_recipe(self, recipe_id, old_amounts, new_amounts):
+        """Переносит изменение состава рецепта в списки покупок
+        всех пользователей, у которых он в корзине"""
+        deltas = dict(new_amounts)
+        for ingredient_id, amount in old_amounts.items():
+            deltas[ingredient_id] = deltas.get(ingredient_id, 0) - amount
+        self.apply(
+            Cart.objects.filter(recipe_id=recipe_id).values_list(
+                "user_id", flat=True
+            ),
+            deltas,
+        )
+
+    def delete_recipe(self, recipe_id):
+        self.change_recipe(recipe_id, self.get_recipe_amounts(recipe_id), {})
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в корзине пользователя"""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Ингредиент",
+    )
+    amount = models.PositiveIntegerField("Количество")
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = "Ингредиент в списке покупок"
+        verbose_name_plural = "Списки покупок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "ingredient"),
+                name="unique_shopping_list_user_ingredient",
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.ingredient} {self.amount} "
+            f"в списке покупок пользователя {self.user}."
+        )
@@ -0,0 +1,38 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, называющее файлы по SHA-256 содержимого.
+
+    Повторная загрузка того же файла не создает копию, а возвращает
+    имя уже сохраненного. Неиспользуемые файлы удаляет команда
+    collect_media_garbage."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        if hasattr(content, "seek"):
+            content.seek(0)
+        for chunk in content.chunks(CHUNK_SIZE):
+            digest.update(chunk)
+        if hasattr(content, "seek"):
+            content.seek(0)
+        directory, filename = posixpath.split(name.replace("\\", "/"))
+        extension = posixpath.splitext(filename)[1].lower()
+        name = posixpath.join(directory, digest.hexdigest() + extension)
+        if self.exists(name):
+            # Свежее время изменения защищает файл от удаления
+            # collect_media_garbage до фиксации ссылки на него
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length=max_length)
@@ -0,0 +1,41 @@
+import mimetypes
+import os
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.views.decorators.http import require_safe
+
+from .images import resize_image
+
+RESIZED_DIR = "resized"
+
+
+@require_safe
+def resized_image(request, width, height, path):
+    """Отдает копию изображения из MEDIA_ROOT, уменьшенную до одного
+    из размеров RESIZED_IMAGE_SIZES, создавая ее при первом запросе"""
+    if (width, height) not in settings.RESIZED_IMAGE_SIZES:
+        raise Http404("Размер не поддерживается")
+    relative_path = "/".join((RESIZED_DIR, f"{width}x{height}", path))
+    try:
+        source_path = safe_join(settings.MEDIA_ROOT, path)
+        target_path = safe_join(settings.MEDIA_ROOT, relative_path)
+    except SuspiciousFileOperation:
+        raise Http404("Изображение не найдено")
+    if path.startswith(f"{RESIZED_DIR}/") or not os.path.isfile(source_path):
+        raise Http404("Изображение не найдено")
+    if not os.path.exists(target_path):
+        try:
+            resize_image(source_path, target_path, (width, height))
+        except (OSError, ValueError):
+            raise Http404("Файл не является изображением")
+    content_type, _ = mimetypes.guess_type(target_path)
+    if settings.MEDIA_ACCEL_REDIRECT_PREFIX:
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = (
+            settings.MEDIA_ACCEL_REDIRECT_PREFIX + relative_path
+        )
+        return response
+    return FileResponse(open(target_path, "rb"), content_type=content_type)